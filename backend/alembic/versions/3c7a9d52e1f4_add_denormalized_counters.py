@@ -0,0 +1,61 @@
+"""Add denormalized counters
+
+Revision ID: 3c7a9d52e1f4
+Revises: 9b3d6e41a2c8
+Create Date: 2026-10-17 18:40:12.204617
+
+"""
+import sqlalchemy as sa
+
+from alembic import op
+
+revision = "3c7a9d52e1f4"
+down_revision = "9b3d6e41a2c8"
+branch_labels = None
+depends_on = None
+
+COUNTERS = [
+    ("articles", "favorites_count"),
+    ("articles", "comments_count"),
+    ("users", "followers_count"),
+    ("users", "following_count"),
+]
+
+
+def upgrade():
+    for table, column in COUNTERS:
+        op.add_column(
+            table,
+            sa.Column(column, sa.Integer(), server_default="0", nullable=False),
+        )
+    op.execute(
+        """
+        UPDATE articles SET
+            favorites_count = (
+                SELECT count(*) FROM favorites
+                WHERE favorites.article = articles.slug
+            ),
+            comments_count = (
+                SELECT count(*) FROM comments
+                WHERE comments.article = articles.slug
+            )
+        """
+    )
+    op.execute(
+        """
+        UPDATE users SET
+            followers_count = (
+                SELECT count(*) FROM followers
+                WHERE followers.author = users.username
+            ),
+            following_count = (
+                SELECT count(*) FROM followers
+                WHERE followers."user" = users.username
+            )
+        """
+    )
+
+
+def downgrade():
+    for table, column in reversed(COUNTERS):
+        op.drop_column(table, column)
@@ -0,0 +1,46 @@
+"""Add followers backfill horizon
+
+Revision ID: 4d8e1a6f2b70
+Revises: 7e2b5c8d1f36
+Create Date: 2026-10-17 22:14:09.318254
+
+"""
+import sqlalchemy as sa
+
+from alembic import op
+from settings import config
+
+revision = "4d8e1a6f2b70"
+down_revision = "7e2b5c8d1f36"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "followers", sa.Column("horizon_created_at", sa.DateTime(), nullable=True)
+    )
+    op.add_column(
+        "followers", sa.Column("horizon_article_id", sa.Integer(), nullable=True)
+    )
+    # The newest fanned out article left out of the feed backfill
+    # of existing follows, as backfill_feed.
+    op.execute(
+        f"""
+        UPDATE followers SET (horizon_created_at, horizon_article_id) = (
+            SELECT articles.created_at, articles.id FROM articles
+            WHERE articles.author = followers.author AND articles.fanned_out
+            ORDER BY articles.created_at DESC, articles.id DESC
+            OFFSET {config.FEED_BACKFILL_LIMIT} LIMIT 1
+        )
+        WHERE followers.author IN (
+            SELECT author FROM articles WHERE fanned_out GROUP BY author
+            HAVING count(*) > {config.FEED_BACKFILL_LIMIT}
+        )
+        """
+    )
+
+
+def downgrade():
+    op.drop_column("followers", "horizon_article_id")
+    op.drop_column("followers", "horizon_created_at")
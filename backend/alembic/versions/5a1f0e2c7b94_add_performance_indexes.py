@@ -0,0 +1,98 @@
+"""Add performance indexes
+
+Revision ID: 5a1f0e2c7b94
+Revises: c118914f3afa
+Create Date: 2026-10-17 13:40:27.118203
+
+"""
+import sqlalchemy as sa
+
+from alembic import op
+
+revision = "5a1f0e2c7b94"
+down_revision = "c118914f3afa"
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    # Listing and keyset pagination of articles.
+    (
+        "ix_articles_created_at_id",
+        "articles",
+        [sa.text("created_at DESC"), sa.text("id DESC")],
+        {},
+    ),
+    # Listing by author.
+    (
+        "ix_articles_author_created_at_id",
+        "articles",
+        ["author", sa.text("created_at DESC"), sa.text("id DESC")],
+        {},
+    ),
+    # Follow checks, feed reads. Stops duplicate follows.
+    ("uq_followers_user_author", "followers", ["user", "author"], {"unique": True}),
+    # Fan-out of a new article to the followers of its author.
+    (
+        "ix_followers_author",
+        "followers",
+        ["author"],
+        {"postgresql_include": ["user"]},
+    ),
+    # Favorite checks, listing by favorited. Stops duplicate favorites.
+    ("uq_favorites_user_article", "favorites", ["user", "article"], {"unique": True}),
+    # Favorites count of an article.
+    ("ix_favorites_article", "favorites", ["article"], {}),
+    # Comments of an article with keyset pagination.
+    (
+        "ix_comments_article_created_at_id",
+        "comments",
+        ["article", "created_at", "id"],
+        {},
+    ),
+    # Listing by tag.
+    ("ix_article_tag_tags_name", "article_tag", ["tags_name", "article_id"], {}),
+    # Tags of a page of articles. Stops duplicate tags of an article.
+    (
+        "uq_article_tag_article_id",
+        "article_tag",
+        ["article_id", "tags_name"],
+        {"unique": True},
+    ),
+]
+
+
+def upgrade():
+    op.execute(
+        """
+        DELETE FROM followers a USING followers b
+        WHERE a."user" = b."user" AND a.author = b.author AND a.id > b.id
+        """
+    )
+    op.execute(
+        """
+        DELETE FROM favorites a USING favorites b
+        WHERE a."user" = b."user" AND a.article = b.article AND a.id > b.id
+        """
+    )
+    op.execute(
+        """
+        DELETE FROM article_tag a USING article_tag b
+        WHERE a.article_id = b.article_id AND a.tags_name = b.tags_name
+        AND a.ctid > b.ctid
+        """
+    )
+    with op.get_context().autocommit_block():
+        for name, table, columns, kwargs in INDEXES:
+            op.create_index(
+                name,
+                table,
+                columns,
+                postgresql_concurrently=True,
+                **kwargs,
+            )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, _, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True)
@@ -0,0 +1,88 @@
+"""Add articles search vector
+
+Revision ID: 7e2b5c8d1f36
+Revises: 3c7a9d52e1f4
+Create Date: 2026-10-17 20:05:37.641390
+
+"""
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from alembic import context, op
+
+revision = "7e2b5c8d1f36"
+down_revision = "3c7a9d52e1f4"
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 10000
+
+
+def search_vector(row: str = "") -> str:
+    return (
+        f"setweight(to_tsvector('english', coalesce({row}title, '')), 'A') || "
+        f"setweight(to_tsvector('english', coalesce({row}description, '')), 'B') || "
+        f"setweight(to_tsvector('english', coalesce({row}body, '')), 'C')"
+    )
+
+
+def upgrade():
+    op.add_column(
+        "articles",
+        sa.Column("search_vector", postgresql.TSVECTOR(), nullable=True),
+    )
+    # Generated columns need PostgreSQL 12, the trigger keeps the vector
+    # of new and changed articles.
+    op.execute(
+        f"""
+        CREATE FUNCTION articles_search_vector_update() RETURNS trigger AS $$
+        BEGIN
+            NEW.search_vector := {search_vector("NEW.")};
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER articles_search_vector_update
+        BEFORE INSERT OR UPDATE OF title, description, body ON articles
+        FOR EACH ROW EXECUTE PROCEDURE articles_search_vector_update()
+        """
+    )
+    with op.get_context().autocommit_block():
+        # Existing articles are filled by ranges of ids,
+        # each batch is committed separately.
+        backfill = (
+            f"UPDATE articles SET search_vector = {search_vector()} "
+            "WHERE search_vector IS NULL"
+        )
+        if context.is_offline_mode():
+            op.execute(backfill)
+        else:
+            bind = op.get_bind()
+            max_id = bind.execute(sa.text("SELECT max(id) FROM articles")).scalar()
+            for start in range(0, max_id or 0, BATCH_SIZE):
+                bind.execute(
+                    sa.text(backfill + " AND id > :start AND id <= :end"),
+                    {"start": start, "end": start + BATCH_SIZE},
+                )
+        op.create_index(
+            "ix_articles_search_vector",
+            "articles",
+            ["search_vector"],
+            postgresql_using="gin",
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_articles_search_vector",
+            table_name="articles",
+            postgresql_concurrently=True,
+        )
+    op.execute("DROP TRIGGER articles_search_vector_update ON articles")
+    op.execute("DROP FUNCTION articles_search_vector_update()")
+    op.drop_column("articles", "search_vector")
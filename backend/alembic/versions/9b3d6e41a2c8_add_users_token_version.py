@@ -0,0 +1,29 @@
+"""Add users token version
+
+Revision ID: 9b3d6e41a2c8
+Revises: 5a1f0e2c7b94
+Create Date: 2026-10-17 15:12:44.530871
+
+"""
+import sqlalchemy as sa
+
+from alembic import op
+
+revision = "9b3d6e41a2c8"
+down_revision = "5a1f0e2c7b94"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "users",
+        sa.Column("token_version", sa.Integer(), server_default="0", nullable=False),
+    )
+    op.drop_column("users", "token")
+
+
+def downgrade():
+    op.add_column("users", sa.Column("token", sa.String(), nullable=True))
+    op.create_unique_constraint("users_token_key", "users", ["token"])
+    op.drop_column("users", "token_version")
@@ -0,0 +1,83 @@
+"""Create feed items
+
+Revision ID: c118914f3afa
+Revises: d17f72f18a88
+Create Date: 2026-10-17 10:02:11.304518
+
+"""
+import sqlalchemy as sa
+
+from alembic import op
+from settings import config
+
+revision = "c118914f3afa"
+down_revision = "d17f72f18a88"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "articles",
+        sa.Column("fanned_out", sa.Boolean(), server_default=sa.true(), nullable=True),
+    )
+    # Articles of authors with more followers than the threshold are pulled.
+    op.execute(
+        f"""
+        UPDATE articles SET fanned_out = false
+        WHERE author IN (
+            SELECT author FROM followers GROUP BY author
+            HAVING count(*) > {config.FEED_FANOUT_THRESHOLD}
+        )
+        """
+    )
+    op.create_table(
+        "feed_items",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("user", sa.String(length=50), nullable=True),
+        sa.Column("article_id", sa.Integer(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(["article_id"], ["articles.id"], ondelete="CASCADE"),
+        sa.ForeignKeyConstraint(["user"], ["users.username"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("user", "article_id"),
+    )
+    op.create_index(
+        "ix_feed_items_user_created_at",
+        "feed_items",
+        ["user", sa.text("created_at DESC"), sa.text("article_id DESC")],
+    )
+    # The latest fanned out articles of each followed author, as backfill_feed.
+    op.execute(
+        f"""
+        INSERT INTO feed_items ("user", article_id, created_at)
+        SELECT followers."user", latest.id, latest.created_at
+        FROM followers CROSS JOIN LATERAL (
+            SELECT articles.id, articles.created_at FROM articles
+            WHERE articles.author = followers.author AND articles.fanned_out
+            ORDER BY articles.created_at DESC, articles.id DESC
+            LIMIT {config.FEED_BACKFILL_LIMIT}
+        ) AS latest
+        ON CONFLICT DO NOTHING
+        """
+    )
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_articles_author_created_at_pulled",
+            "articles",
+            ["author", sa.text("created_at DESC"), sa.text("id DESC")],
+            postgresql_where=sa.text("fanned_out IS false"),
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade():
+    op.drop_index("ix_feed_items_user_created_at", table_name="feed_items")
+    op.drop_table("feed_items")
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_articles_author_created_at_pulled",
+            table_name="articles",
+            postgresql_concurrently=True,
+        )
+    op.drop_column("articles", "fanned_out")
@@ -0,0 +1,78 @@
+"""
+Login latency under concurrent load.
+
+Registers a user and sends concurrent logins to a running server,
+while a cheap request is measured in the same time to show
+that the hashing does not stall the event loop:
+
+python benchmarks/login.py --url http://127.0.0.1:8000 --concurrency 50
+"""
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+from typing import List
+
+import httpx
+
+
+def percentile(values: List[float], percent: int) -> float:
+    values = sorted(values)
+    index = max(0, round(len(values) * percent / 100) - 1)
+    return values[index]
+
+
+def report(name: str, values: List[float]) -> None:
+    print(
+        f"{name}: {len(values)} requests, "
+        f"p50 {statistics.median(values) * 1000:.1f} ms, "
+        f"p99 {percentile(values, 99) * 1000:.1f} ms, "
+        f"max {max(values) * 1000:.1f} ms"
+    )
+
+
+async def timed(client: httpx.AsyncClient, method: str, url: str, **kwargs) -> float:
+    start = time.perf_counter()
+    response = await client.request(method, url, **kwargs)
+    response.raise_for_status()
+    return time.perf_counter() - start
+
+
+async def run(url: str, concurrency: int, requests: int) -> None:
+    name = uuid.uuid4().hex[:12]
+    user = {"email": f"{name}@bench.com", "password": name, "username": name}
+    async with httpx.AsyncClient(
+        base_url=url,
+        timeout=60,
+        limits=httpx.Limits(max_connections=concurrency + 1),
+    ) as client:
+        await client.post("/users", json={"user": user})
+        login = {"user": {"email": user["email"], "password": user["password"]}}
+        semaphore = asyncio.Semaphore(concurrency)
+        done = asyncio.Event()
+
+        async def one_login() -> float:
+            async with semaphore:
+                return await timed(client, "POST", "/users/login", json=login)
+
+        async def tags() -> List[float]:
+            latency = []
+            while not done.is_set():
+                latency.append(await timed(client, "GET", "/tags"))
+            return latency
+
+        tags_task = asyncio.create_task(tags())
+        login_latency = await asyncio.gather(*[one_login() for _ in range(requests)])
+        done.set()
+        report("login", login_latency)
+        report("tags during logins", await tags_task)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=500)
+    args = parser.parse_args()
+    asyncio.run(run(args.url, args.concurrency, args.requests))
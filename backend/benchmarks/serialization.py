@@ -0,0 +1,85 @@
+"""
+Serialization of an article list by the default and the fast response path.
+
+Both paths build schemas.GetArticles from ORM-like objects, the default
+path then validates it against response_model and encodes it with
+jsonable_encoder as FastAPI does, the fast path renders it with orjson:
+
+python benchmarks/serialization.py --articles 100
+"""
+import argparse
+import asyncio
+import os
+import sys
+import timeit
+from datetime import datetime
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.responses import JSONResponse  # noqa: E402
+from fastapi.routing import serialize_response  # noqa: E402
+from fastapi.utils import create_response_field  # noqa: E402
+
+from src.articles import schemas  # noqa: E402
+from src.router_setting import FastJSONResponse  # noqa: E402
+
+
+def make_articles(count: int) -> list:
+    author = SimpleNamespace(
+        username="author", bio="bio", image="image", following=False
+    )
+    return [
+        SimpleNamespace(
+            slug=f"article-{number}",
+            title=f"Article {number}",
+            description="description",
+            body="body " * 100,
+            tagList=["first", "second"],
+            createdAt=datetime.now(),
+            updatedAt=datetime.now(),
+            favorited=False,
+            favoritesCount=number,
+            author=author,
+        )
+        for number in range(count)
+    ]
+
+
+def default_path(loop, field, articles) -> bytes:
+    content = schemas.GetArticles(articles=articles, articlesCount=len(articles))
+    encoded = loop.run_until_complete(
+        serialize_response(field=field, response_content=content)
+    )
+    return JSONResponse(encoded).body
+
+
+def fast_path(articles) -> bytes:
+    content = schemas.GetArticles(articles=articles, articlesCount=len(articles))
+    return FastJSONResponse(content).body
+
+
+def report(name: str, seconds: float, number: int) -> None:
+    print(f"{name}: {seconds / number * 1000:.2f} ms per response")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--articles", type=int, default=100)
+    parser.add_argument("--number", type=int, default=200)
+    args = parser.parse_args()
+
+    loop = asyncio.new_event_loop()
+    field = create_response_field(name="GetArticles", type_=schemas.GetArticles)
+    articles = make_articles(args.articles)
+
+    report(
+        "default",
+        timeit.timeit(lambda: default_path(loop, field, articles), number=args.number),
+        args.number,
+    )
+    report(
+        "fast",
+        timeit.timeit(lambda: fast_path(articles), number=args.number),
+        args.number,
+    )
@@ -1,20 +1,70 @@
+import asyncio
+
 from fastapi import FastAPI
 
 from settings import config
 from src.articles.router import router_article
-from src.db.database import create_engine_async_app
+from src.db.database import ReadReplicas, create_engine_async_app
+from src.db.redis import close_redis, create_redis_async_app
+from src.metrics.router import router_metrics
+from src.response_cache import ResponseCacheMiddleware
+from src.users.cache import listen_invalidations
+from src.users.passwords import password_hasher
 from src.users.router import router_user
 
 
 def create_app() -> FastAPI:
 
     app = FastAPI()
-    (engine, sessionmaker) = create_engine_async_app(config.sqlalchemy_db)
+    (engine, sessionmaker) = create_engine_async_app(
+        config.sqlalchemy_db, **config.db_engine_options
+    )
     app.state.engine = engine
     app.state.sessionmaker = sessionmaker
+    app.state.replicas = ReadReplicas(
+        [str(url) for url in config.DATABASE_REPLICA_URLS],
+        **config.db_engine_options,
+    )
+
+    @app.on_event("startup")
+    async def open_redis_pool():
+        app.state.redis = create_redis_async_app(
+            config.REDIS_URL,
+            max_connections=config.REDIS_MAX_CONNECTIONS,
+            pool_timeout=config.REDIS_POOL_TIMEOUT,
+            socket_timeout=config.REDIS_SOCKET_TIMEOUT,
+        )
+        app.state.user_cache_listener = asyncio.create_task(
+            listen_invalidations(app.state.redis)
+        )
+
+    @app.on_event("shutdown")
+    async def close_redis_pool():
+        app.state.user_cache_listener.cancel()
+        await asyncio.gather(app.state.user_cache_listener, return_exceptions=True)
+        await close_redis(app.state.redis)
+
+    @app.on_event("shutdown")
+    async def close_replicas():
+        await app.state.replicas.dispose()
+
+    @app.on_event("startup")
+    async def start_password_hasher():
+        password_hasher.start()
+
+    @app.on_event("shutdown")
+    async def stop_password_hasher():
+        password_hasher.shutdown()
+
+    app.add_middleware(
+        ResponseCacheMiddleware,
+        ttl=config.RESPONSE_CACHE_TTL,
+        max_size=config.RESPONSE_CACHE_MAX_SIZE,
+    )
 
     app.include_router(router_user)
     app.include_router(router_article)
+    app.include_router(router_metrics)
     return app
 
 
@@ -0,0 +1,61 @@
+"""
+Import articles from an NDJSON file.
+
+Each line of the file is a body of "Create an article" request,
+the articles are created by the user of the token:
+
+python scripts/import_articles.py articles.ndjson --token <token>
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from collections import Counter
+from typing import AsyncIterator
+
+import httpx
+
+
+async def read_file(path: str, chunk_size: int = 1024 * 1024) -> AsyncIterator[bytes]:
+    with open(path, "rb") as file:
+        while chunk := file.read(chunk_size):
+            yield chunk
+
+
+async def run(url: str, token: str, path: str) -> None:
+    statuses = Counter()
+    start = time.perf_counter()
+    async with httpx.AsyncClient(base_url=url, timeout=None) as client:
+        async with client.stream(
+            "POST",
+            "/articles/import",
+            content=read_file(path),
+            headers={
+                "Authorization": f"Token {token}",
+                "Content-Type": "application/x-ndjson",
+            },
+        ) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                result = json.loads(line)
+                statuses[result["status"]] += 1
+                if result["status"] != "created":
+                    print(line, file=sys.stderr)
+    elapsed = time.perf_counter() - start
+    total = sum(statuses.values())
+    print(
+        f"{total} lines in {elapsed:.1f} s, {total / elapsed:.0f} lines/s: "
+        + ", ".join(f"{status} {count}" for status, count in sorted(statuses.items()))
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("path")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--token", required=True)
+    args = parser.parse_args()
+    asyncio.run(run(args.url, args.token, args.path))
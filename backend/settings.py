@@ -1,5 +1,5 @@
-import aioredis
-from aioredis.client import Redis
+from typing import Any, Dict, List, Literal, Optional
+
 from pydantic import BaseSettings
 from pydantic.networks import AnyUrl
 
@@ -9,10 +9,43 @@ class PostgresDsnAsyncpg(AnyUrl):
     user_required = True
 
 
+DB_PROFILES = {
+    "production": {
+        "echo": False,
+        "pool_size": 10,
+        "max_overflow": 10,
+        "pool_timeout": 10,
+        "pool_pre_ping": True,
+        "pool_recycle": 30 * 60,
+        "statement_cache_size": 500,
+    },
+    "debug": {
+        "echo": True,
+        "pool_size": 5,
+        "max_overflow": 0,
+        "pool_timeout": 30,
+        "pool_pre_ping": False,
+        "pool_recycle": -1,
+        "statement_cache_size": 100,
+    },
+}
+
+
 class Settings(BaseSettings):
     SECRET: str
     ALGORITHM: str = "HS256"
+    TOKEN_EXPIRE_MINUTES: int = 7 * 24 * 60
     DATABASE_URL: PostgresDsnAsyncpg = None
+    DATABASE_REPLICA_URLS: List[PostgresDsnAsyncpg] = []
+    REPLICA_STICKY_SECONDS: int = 5
+    DB_PROFILE: Literal["production", "debug"] = "production"
+    DB_ECHO: Optional[bool] = None
+    DB_POOL_SIZE: Optional[int] = None
+    DB_MAX_OVERFLOW: Optional[int] = None
+    DB_POOL_TIMEOUT: Optional[int] = None
+    DB_POOL_PRE_PING: Optional[bool] = None
+    DB_POOL_RECYCLE: Optional[int] = None
+    DB_STATEMENT_CACHE_SIZE: Optional[int] = None
     API_KEY_SCHEME: str = "Token"
     API_KEY_NAME: str = "Authorization"
     DESCRIPTION_TOKEN: str = """
@@ -25,16 +58,40 @@ class Settings(BaseSettings):
     Token xxxxxx.yyyyyyy.zzzzzz
     """
     REDIS_URL: str
+    REDIS_MAX_CONNECTIONS: int = 50
+    REDIS_POOL_TIMEOUT: int = 5
+    REDIS_SOCKET_TIMEOUT: int = 5
+    REDIS_CACHE_TTL: int = 60 * 60
+    RESPONSE_CACHE_TTL: int = 60
+    RESPONSE_CACHE_MAX_SIZE: int = 1024 * 1024
+    USER_CACHE_SIZE: int = 10000
+    USER_CACHE_TTL: int = 60
+    FEED_FANOUT_THRESHOLD: int = 10000
+    FEED_BACKFILL_LIMIT: int = 1000
+    IMPORT_BATCH_SIZE: int = 1000
+    TAG_CACHE_SIZE: int = 10000
+    SCRYPT_N: int = 2**14
+    SCRYPT_R: int = 8
+    SCRYPT_P: int = 1
+    PASSWORD_HASH_WORKERS: int = 2
+    PASSWORD_HASH_PENDING: int = 64
+    PASSWORD_HASH_TIMEOUT: int = 5
 
     @property
     def sqlalchemy_db(self) -> str:
         return str(self.DATABASE_URL)
 
     @property
-    def redis_db(self) -> Redis:
-        return aioredis.from_url(
-            config.REDIS_URL, encoding="utf-8", decode_responses=True
-        )
+    def db_engine_options(self) -> Dict[str, Any]:
+        """
+        Options of the DB_PROFILE, replaced by DB_* values that are set.
+        """
+        options = dict(DB_PROFILES[self.DB_PROFILE])
+        for name in options:
+            value = getattr(self, f"DB_{name.upper()}")
+            if value is not None:
+                options[name] = value
+        return options
 
     class Config:
         env_file = ".env"
@@ -1,19 +1,51 @@
-from typing import List, Optional
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple, Union
 
+from aioredis import Redis
+from asyncpg import InterfaceError, PostgresError
 from settings import config
 from slugify import slugify
-from sqlalchemy import delete, update
+from sqlalchemy import (
+    String,
+    delete,
+    func,
+    literal,
+    literal_column,
+    tuple_,
+    update,
+)
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy.orm import selectinload
+from sqlalchemy.sql import ColumnElement
+from sqlalchemy.sql.dml import Update
 from src.articles import schemas
+from src.articles.feed import (
+    fan_out_clause,
+    push_article,
+    push_articles,
+    select_feed_ids,
+)
+from src.articles.tags import tag_cache, upsert_tags
 from src.articles.utils import (
+    ArticleRow,
     add_favorited,
-    add_tags_authors_favorites_time_in_articles,
+    article_author_key,
+    cache_article,
+    change_favorites,
+    get_article_key,
+    get_list_articles,
+    load_article,
+    paginate_articles,
+    select_articles,
 )
-from src.db.models import Article, Comment, Favorite, Follow, Tag, User
+from src.conditional import bump_versions
+from src.db.database import is_replica
+from src.db.models import Article, Comment, Favorite, Tag, User, article_tag_table
+from src.response_cache import invalidate_responses
 from src.users import utils as user_utils
-from src.users.crud import check_subscribe
+from src.users.schemas import ProfileUser
 
 
 async def get_articles_auth_or_not(
@@ -24,155 +56,365 @@ async def get_articles_auth_or_not(
     limit: Optional[int] = 20,
     offset: Optional[int] = 0,
     current_user: Optional[User] = None,
-) -> List[Article]:
+    cursor: Optional[Tuple[datetime, int]] = None,
+    summary: bool = False,
+) -> List[ArticleRow]:
     """
-    Get list Article for pydantic model.
+    Get list of articles for pydantic model.
 
     Filtering by tag name, author username, favorited username.
-    Optional receipt of articles by limit(default 20), offset(default 0).
+    Optional receipt of articles by limit(default 20), offset(default 0)
+    and cursor (created_at, id) of the last article on the previous page.
+    The summary is without the body of articles.
 
     Auth is optional.
     """
-    query = select(Article)
-    stmt_tag = await db.execute(select(Tag).filter(Tag.name == tag))
-    tag_db = stmt_tag.scalars().first()
+    query = select_articles(current_user, summary)
     if tag:
-        if tag_db:
-            query = query.join(Article.tag).filter(Article.tag.contains(tag_db))
+        query = query.where(Article.tag.any(Tag.name == tag))
     if author:
         query = query.where(Article.author == author)
     if favorited:
-        query = query.join(Favorite).where(Favorite.user == favorited)
-    query = (
-        query.order_by(Article.created_at.desc())
-        .offset(offset)
-        .limit(limit)
-        .options(selectinload(Article.tag), selectinload(Article.authors))
-    )
+        query = query.join(Favorite, Favorite.article == Article.slug).where(
+            Favorite.user == favorited
+        )
+    query = paginate_articles(query, limit, offset, cursor)
+    return await get_list_articles(db, query)
 
-    stmt = await db.execute(query)
-    articles = stmt.scalars().unique().all()
-    await db.close()
-    articles = await add_tags_authors_favorites_time_in_articles(db, articles)
 
-    if current_user:
-        articles = await add_favorited(db, articles, current_user)
-        for article in articles:
-            article.author = await user_utils.add_following(
-                db, article.author, current_user
-            )
+async def search_articles(
+    db: AsyncSession,
+    q: str,
+    limit: Optional[int] = 20,
+    current_user: Optional[User] = None,
+    cursor: Optional[Tuple[float, int]] = None,
+    summary: bool = False,
+) -> List[ArticleRow]:
+    """
+    Full-text search of articles by title, description and body.
+    The matches are found by the GIN index of the stored search vector
+    and ordered from the most relevant by (rank, id).
+    Optional receipt of articles by limit(default 20)
+    and cursor (rank, id) of the last article on the previous page.
+    The summary is without the body of articles.
 
-    return articles
+    Auth is optional.
+    """
+    query = func.websearch_to_tsquery(literal_column("'english'"), q)
+    rank = func.ts_rank(Article.search_vector, query)
+    ranked = select(Article.id, rank.label("rank")).where(
+        Article.search_vector.op("@@")(query)
+    )
+    if cursor:
+        ranked = ranked.where(tuple_(rank, Article.id) < cursor)
+    ranked = ranked.order_by(rank.desc(), Article.id.desc()).limit(limit).subquery()
+    return await get_list_articles(
+        db,
+        select_articles(current_user, summary)
+        .join(ranked, ranked.c.id == Article.id)
+        .add_columns(ranked.c.rank)
+        .order_by(ranked.c.rank.desc(), Article.id.desc()),
+    )
 
 
 async def feed_article(
-    db: AsyncSession, user: User, limit: int, offset: int
-) -> List[Article]:
+    db: AsyncSession,
+    user: User,
+    limit: int,
+    offset: int,
+    cursor: Optional[Tuple[datetime, int]] = None,
+    summary: bool = False,
+) -> List[ArticleRow]:
     """
-    Gets articles from users you follow.
-    Optional receipt of articles by limit(default 20), offset(default 0).
+    Gets articles from users you follow from the materialized feed.
+    Optional receipt of articles by limit(default 20), offset(default 0)
+    and cursor (created_at, id) of the last article on the previous page.
+    The summary is without the body of articles.
 
     Auth is required.
     """
-    stmt = await db.execute(
-        select(Article)
-        .join(Follow, Follow.author == Article.author)
-        .where(Follow.user == user.username)
-        .order_by(Article.created_at.desc())
-        .offset(offset)
-        .limit(limit)
-        .options(selectinload(Article.tag), selectinload(Article.authors))
+    query = (
+        select_articles(user, summary)
+        .where(Article.id.in_(select_feed_ids(user, limit, offset, cursor)))
+        .order_by(Article.created_at.desc(), Article.id.desc())
     )
-    articles = stmt.scalars().all()
-    articles = await add_tags_authors_favorites_time_in_articles(db, articles)
-    articles = await add_favorited(db, articles, user)
-    for article in articles:
-        article.author = await user_utils.add_following(db, article.author, user)
-    return articles
+    return await get_list_articles(db, query)
 
 
 async def create_article(
-    db: AsyncSession, data: schemas.CreateArticleRequest, user: User
-) -> Article:
+    db: AsyncSession, redis: Redis, data: schemas.CreateArticleRequest, user: User
+) -> Optional[ArticleRow]:
     """
     Creating an article based on data from a pydantic query model.
+    The article is pushed into the followers feeds in the same transaction.
+    Cached responses of article lists and tags are removed.
+    Returns None if an article with the same slug exists.
     """
-    tags = []
-    if data.article.tagList:
-        stmt = await db.execute(select(Tag).filter(Tag.name.in_(data.article.tagList)))
-        tags_db = stmt.scalars().all()
-        await db.close()
-        tags = [tag_name for tag_name in tags_db]
-
-    db_article = Article(
-        slug=slugify(data.article.title),
-        title=data.article.title,
-        description=data.article.description,
-        body=data.article.body,
-        author=user.username,
-        tag=tags,
+    stmt = await db.execute(
+        insert(Article)
+        .values(
+            slug=slugify(data.article.title),
+            title=data.article.title,
+            description=data.article.description,
+            body=data.article.body,
+            author=user.username,
+            fanned_out=fan_out_clause(user.username),
+        )
+        .on_conflict_do_nothing(index_elements=["slug"])
+        .returning(
+            Article.id,
+            Article.slug,
+            Article.title,
+            Article.description,
+            Article.body,
+            Article.author,
+            Article.fanned_out,
+            Article.created_at,
+            Article.updated_at,
+        )
     )
-    db.add(db_article)
+    db_article = stmt.first()
+    if not db_article:
+        return None
+
+    tags = await upsert_tags(db, data.article.tagList or [])
+    if tags:
+        await db.execute(
+            insert(article_tag_table).values(
+                [{"article_id": db_article.id, "tags_name": name} for name in tags]
+            )
+        )
+    if db_article.fanned_out:
+        await push_article(db, db_article)
     await db.commit()
     await db.close()
+    tag_cache.update(tags)
+    await invalidate_responses(redis, "articles", "tags")
+    await bump_versions(redis, "tags")
+
+    return ArticleRow(
+        {
+            **db_article._mapping,
+            "tag_list": list(tags),
+            "favorites_count": 0,
+            "author_username": user.username,
+            "author_bio": user.bio,
+            "author_image": user.image,
+        }
+    )
+
+
+async def import_articles(
+    db: AsyncSession,
+    redis: Redis,
+    articles: List[Tuple[int, schemas.ImportArticle]],
+    user: User,
+) -> List[dict]:
+    """
+    Import a batch of numbered articles of the user in one transaction.
+    Missing tags are created by one statement, the articles are inserted
+    by one multi-row statement and their tags are copied into "article_tag".
+    Returns the result of each article, an article with an existing slug
+    is skipped. If the batch fails, it is rolled back and every article
+    gets the "error" result.
+    Cached responses of article lists and tags are removed.
+    """
+    slugs = {}
+    for number, article in articles:
+        slugs.setdefault(slugify(article.title), (number, article))
+    try:
+        tags, created = await insert_articles(db, slugs, user)
+    except (SQLAlchemyError, PostgresError, InterfaceError) as error:
+        await db.rollback()
+        return [
+            {"line": number, "status": "error", "detail": str(error)}
+            for number, _ in articles
+        ]
+    tag_cache.update(tags)
+    if created:
+        await invalidate_responses(redis, "articles", "tags")
+        await bump_versions(redis, "tags")
+
+    results = []
+    for number, article in articles:
+        slug = slugify(article.title)
+        if slug in created and slugs[slug][0] == number:
+            results.append({"line": number, "status": "created", "slug": slug})
+        else:
+            results.append({"line": number, "status": "exists", "slug": slug})
+    return results
+
+
+async def insert_articles(
+    db: AsyncSession,
+    slugs: Dict[str, Tuple[int, schemas.ImportArticle]],
+    user: User,
+) -> Tuple[Dict[str, int], Dict[str, int]]:
+    """
+    Insert the articles by slug with their tags and commit.
+    Returns ids of the tags and ids of the created articles by slug.
+    """
+    tags = await upsert_tags(
+        db, (tag for _, article in slugs.values() for tag in article.tagList or [])
+    )
+    fanned_out = await db.scalar(select(fan_out_clause(user.username)))
+    stmt = await db.execute(
+        insert(Article)
+        .values(
+            [
+                {
+                    "slug": slug,
+                    "title": article.title,
+                    "description": article.description,
+                    "body": article.body,
+                    "author": user.username,
+                    "fanned_out": fanned_out,
+                }
+                for slug, (_, article) in slugs.items()
+            ]
+        )
+        .on_conflict_do_nothing(index_elements=["slug"])
+        .returning(Article.slug, Article.id)
+    )
+    created = dict(stmt.all())
+
+    records = [
+        (created[slug], tag)
+        for slug, (_, article) in slugs.items()
+        if slug in created
+        for tag in dict.fromkeys(article.tagList or [])
+        if tag
+    ]
+    if records:
+        connection = await (await db.connection()).get_raw_connection()
+        await connection.driver_connection.copy_records_to_table(
+            article_tag_table.name,
+            records=records,
+            columns=["article_id", "tags_name"],
+        )
+    if created and fanned_out:
+        await push_articles(db, list(created.values()))
+    await db.commit()
+    return tags, created
 
-    db_article.tagList = [tag.name for tag in db_article.tag]
-    db_article.author = user
-    db_article.createdAt = db_article.created_at
-    db_article.updatedAt = db_article.updated_at
-    return db_article
+
+async def get_article_author(
+    db: AsyncSession, redis: Redis, slug: str
+) -> Optional[str]:
+    """
+    Username of the author of the article or None on slug.
+    The author is cached by slug, the database is queried on a cache miss.
+    """
+    key = article_author_key(slug)
+    author = await redis.get(key)
+    if author is None:
+        stmt = await db.execute(select(Article.author).where(Article.slug == slug))
+        author = stmt.scalar()
+        if author is not None:
+            await redis.set(key, author, ex=config.REDIS_CACHE_TTL)
+    return author
 
 
 async def get_single_article_auth_or_not_auth(
-    db: AsyncSession, slug: str, current_user: Optional[User] = None
-) -> Article or None:
+    db: AsyncSession,
+    redis: Redis,
+    slug: str,
+    current_user: Optional[User] = None,
+    author: Optional[str] = None,
+) -> Optional[ArticleRow]:
     """
-    Get single Article or None on slug.
+    Get single article or None on slug.
+    On a cache miss the article is read with one query and cached
+    by slug and the versions of the article and its author
+    without the flags of the user.
+    Rows read from a replica may lag behind the version and are not cached.
     Auth is optional.
     """
-    stmt = await db.execute(
-        select(Article)
-        .where(Article.slug == slug)
-        .options(selectinload(Article.tag), selectinload(Article.authors))
-    )
-    articles = stmt.scalars().all()
+    if author is None:
+        author = await get_article_author(db, redis, slug)
+        if author is None:
+            return None
+    key = await get_article_key(redis, slug, author)
+    cached = await redis.get(key)
+    if cached is None:
+        stmt = await db.execute(
+            select_articles(current_user).where(Article.slug == slug)
+        )
+        row = stmt.first()
+        await db.close()
+        if not row:
+            return None
+        if not is_replica(db):
+            await cache_article(redis, key, row._mapping)
+        return ArticleRow(row._mapping)
 
-    await db.close()
-    if not articles:
-        return None
-    articles = await add_tags_authors_favorites_time_in_articles(db, articles)
+    article = load_article(cached)
     if current_user:
-        articles = await add_favorited(db, articles, current_user)
-        for article in articles:
-            subscribe = await check_subscribe(
-                db, current_user.username, article.author.username
-            )
-            if subscribe:
-                article.author.following = True
-
-    return articles[0]
+        await add_favorited(db, redis, [article], current_user)
+        if article.author.username != current_user.username:
+            await user_utils.add_following_authors(db, [article.author], current_user)
+    return article
 
 
 async def change_article(
-    db: AsyncSession, slug: str, article_data: schemas.UpdateArticle, user: User
+    db: AsyncSession,
+    redis: Redis,
+    slug: str,
+    article_data: schemas.UpdateArticle,
+    user: User,
 ) -> Article:
     """
     Edit Article by slug.
+    If tagList is set, missing tags are created
+    and the tags of the article are replaced.
+    Cached responses with the article are removed.
     """
+    values = article_data.article.dict(exclude_unset=True)
+    tag_list = values.pop("tagList", None)
     up_article = (
         update(Article)
         .where(Article.slug == slug)
-        .values(author=user.username, **article_data.article.dict(exclude_unset=True))
-        .execution_options(synchronize_session="fetch")
+        .values(author=user.username, **values)
+        .returning(Article.id)
+        .execution_options(synchronize_session=False)
     )
-    await db.execute(up_article)
+    article_id = (await db.execute(up_article)).scalar()
+    tags = {}
+    if tag_list is not None:
+        tags = await upsert_tags(db, tag_list)
+        await db.execute(
+            delete(article_tag_table).where(
+                article_tag_table.c.article_id == article_id,
+                article_tag_table.c.tags_name.not_in(list(tags)),
+            )
+        )
+        if tags:
+            await db.execute(
+                insert(article_tag_table)
+                .values(
+                    [{"article_id": article_id, "tags_name": name} for name in tags]
+                )
+                .on_conflict_do_nothing()
+            )
     await db.commit()
+    tag_cache.update(tags)
+    if tag_list is not None:
+        await invalidate_responses(redis, "articles", f"article:{slug}", "tags")
+        await bump_versions(redis, f"article:{slug}", "tags")
+    else:
+        await invalidate_responses(redis, "articles", f"article:{slug}")
+        await bump_versions(redis, f"article:{slug}")
 
 
-async def delete_article(db: AsyncSession, slug: str):
+async def delete_article(db: AsyncSession, redis: Redis, slug: str):
     """
     Delete Article by slug.
+    Feed items of the article are removed by the cascade,
+    the slug is removed from favorites sets of users in Redis
+    and cached responses with the article are removed.
     """
+    stmt = await db.execute(select(Favorite.user).where(Favorite.article == slug))
+    favorites_users = stmt.scalars().all()
     del_article = (
         delete(Article)
         .where(Article.slug == slug)
@@ -180,41 +422,84 @@ async def delete_article(db: AsyncSession, slug: str):
     )
     await db.execute(del_article)
     await db.commit()
-    await config.redis_db.hdel("count_favorites", slug)
+
+    await redis.delete(article_author_key(slug))
+    if favorites_users:
+        pipe = redis.pipeline(transaction=False)
+        for username in favorites_users:
+            change_favorites(pipe, username, slug, favorited=False)
+        await pipe.execute()
+    await invalidate_responses(
+        redis, "articles", f"article:{slug}", f"comments:{slug}", "tags"
+    )
+    await bump_versions(redis, f"article:{slug}")
 
 
 async def get_comments(
-    db: AsyncSession, slug: str, auth_user: Optional[User] = None
-) -> List[Comment]:
+    db: AsyncSession,
+    slug: str,
+    auth_user: Optional[User] = None,
+    limit: Optional[int] = 20,
+    cursor: Optional[Tuple[datetime, int]] = None,
+) -> List[schemas.Comment]:
     """
-    Get article comments on slug.
+    Get article comments on slug, oldest first.
+    Optional receipt of comments by limit(default 20)
+    and cursor (created_at, id) of the last comment on the previous page.
+
+    Comments and the profile columns of authors are loaded with one query.
     Auth is optional.
     """
-    stmt = await db.execute(select(Comment).where(Comment.article == slug))
-    comments = stmt.scalars().all()
-    for comment in comments:
-        stmt_author = await db.execute(select(User).where(User.id == comment.author))
-        comment.author = stmt_author.scalars().first()
-        await db.close()
-
-        if auth_user:
-            comment.author = await user_utils.add_following(
-                db, comment.author, auth_user
-            )
-        comment.createdAt = comment.created_at
-        comment.updatedAt = comment.updated_at
-    return comments
+    query = (
+        select(Comment, User.username, User.bio, User.image)
+        .join(User, User.id == Comment.author)
+        .where(Comment.article == slug)
+    )
+    if cursor:
+        query = query.where(tuple_(Comment.created_at, Comment.id) > cursor)
+    query = query.order_by(Comment.created_at, Comment.id).limit(limit)
+    stmt = await db.execute(query)
+    rows = stmt.all()
+
+    authors = [
+        ProfileUser(username=username, bio=bio, image=image)
+        for _, username, bio, image in rows
+    ]
+    if auth_user:
+        await user_utils.add_following_authors(db, authors, auth_user)
+    return [
+        schemas.Comment(
+            id=comment.id,
+            createdAt=comment.created_at,
+            updatedAt=comment.updated_at,
+            body=comment.body,
+            author=author,
+        )
+        for (comment, *_), author in zip(rows, authors)
+    ]
+
+
+async def count_comments(db: AsyncSession, slug: str) -> Optional[int]:
+    """
+    Get the number of article comments on slug from the counter column.
+    Returns None if the article is not found.
+    """
+    return await db.scalar(select(Article.comments_count).where(Article.slug == slug))
 
 
 async def create_comment(
-    db: AsyncSession, data: schemas.CreateComment, slug: str, user: User
+    db: AsyncSession, redis: Redis, data: schemas.CreateComment, slug: str, user: User
 ) -> Comment:
     """
-    Create a comment for an article by slug and user.
+    Create a comment for an article by slug and user
+    and increase "comments_count" in the same transaction.
+    Cached responses with comments of the article are removed.
     """
     db_comment = Comment(body=data.comment.body, author=user.id, article=slug)
     db.add(db_comment)
+    await db.execute(update_article_counts(slug, comments_count=1))
     await db.commit()
+    await invalidate_responses(redis, f"comments:{slug}")
 
     db_comment.author = user
     db_comment.createdAt = db_comment.created_at
@@ -222,17 +507,23 @@ async def create_comment(
     return db_comment
 
 
-async def delete_comment(db: AsyncSession, slug: str, id: str, user: User):
+async def delete_comment(
+    db: AsyncSession, redis: Redis, slug: str, id: str, user: User
+):
     """
-    Delete the comment on slug and the author of the article.
+    Delete the comment on slug and the author of the article
+    and decrease "comments_count" in the same transaction.
+    Cached responses with comments of the article are removed.
     """
-    del_comment = (
+    deleted = (
         delete(Comment)
         .where(Comment.article == slug, Comment.id == id)
-        .execution_options(synchronize_session="fetch")
+        .returning(Comment.article)
+        .cte("deleted")
     )
-    await db.execute(del_comment)
+    await db.execute(update_article_counts(deleted.c.article, comments_count=-1))
     await db.commit()
+    await invalidate_responses(redis, f"comments:{slug}")
 
 
 async def get_comment(db: AsyncSession, slug: str, id: str) -> Comment:
@@ -246,30 +537,76 @@ async def get_comment(db: AsyncSession, slug: str, id: str) -> Comment:
     return comment
 
 
-async def create_favorite(db: AsyncSession, slug: str, user: User):
+def update_article_counts(article: Union[str, ColumnElement], **steps: int) -> Update:
     """
-    Create Favorite model by article slug.
+    Query changing the counter columns of the article by steps,
+    "updated_at" of the article is kept.
     """
-    favorite = Favorite(article=slug, user=user.username)
-    db.add(favorite)
+    return (
+        update(Article)
+        .where(Article.slug == article)
+        .values(
+            updated_at=Article.updated_at,
+            **{name: getattr(Article, name) + step for name, step in steps.items()},
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def create_favorite(
+    db: AsyncSession, redis: Redis, slug: str, user: User
+) -> bool:
+    """
+    Create Favorite model by article slug and increase "favorites_count".
+    The cached article and cached responses with the article are reset.
+    Returns False if the article is not found or is already favorited.
+    """
+    inserted = (
+        insert(Favorite)
+        .from_select(
+            ["article", "user"],
+            select(Article.slug, literal(user.username, String)).where(
+                Article.slug == slug
+            ),
+        )
+        .on_conflict_do_nothing()
+        .returning(Favorite.article)
+        .cte("inserted")
+    )
+    stmt = await db.execute(
+        update_article_counts(inserted.c.article, favorites_count=1).returning(
+            Article.id
+        )
+    )
+    if stmt.first() is None:
+        return False
     await db.commit()
-    await config.redis_db.hset("favorites", slug, user.username)
-    await config.redis_db.hincrby("count_favorites", slug, 1)
+    pipe = redis.pipeline(transaction=False)
+    change_favorites(pipe, user.username, slug, favorited=True)
+    await pipe.execute()
+    await invalidate_responses(redis, "articles", f"article:{slug}")
+    await bump_versions(redis, f"article:{slug}")
+    return True
 
 
-async def delete_favorite(db: AsyncSession, slug: str, user: User):
+async def delete_favorite(db: AsyncSession, redis: Redis, slug: str, user: User):
     """
-    Delete Favorite model by article slug and user.
+    Delete Favorite model by article slug and user and decrease "favorites_count".
+    The cached article and cached responses with the article are reset.
     """
-    del_favorite = (
+    deleted = (
         delete(Favorite)
         .where(Favorite.article == slug, Favorite.user == user.username)
-        .execution_options(synchronize_session="fetch")
+        .returning(Favorite.article)
+        .cte("deleted")
     )
-    await db.execute(del_favorite)
+    await db.execute(update_article_counts(deleted.c.article, favorites_count=-1))
     await db.commit()
-    await config.redis_db.hdel("favorites", slug)
-    await config.redis_db.hincrby("count_favorites", slug, -1)
+    pipe = redis.pipeline(transaction=False)
+    change_favorites(pipe, user.username, slug, favorited=False)
+    await pipe.execute()
+    await invalidate_responses(redis, "articles", f"article:{slug}")
+    await bump_versions(redis, f"article:{slug}")
 
 
 async def select_tags(db: AsyncSession) -> List[str]:
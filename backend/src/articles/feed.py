@@ -0,0 +1,180 @@
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from settings import config
+from sqlalchemy import (
+    DateTime,
+    Integer,
+    String,
+    cast,
+    delete,
+    func,
+    tuple_,
+    union,
+    update,
+)
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.sql import Select
+from src.db.models import Article, FeedItem, Follow, User
+
+
+def fan_out_clause(author: str):
+    """
+    SQL expression checking that new articles of the author are pushed
+    into followers feeds.
+    False if the author has more followers than FEED_FANOUT_THRESHOLD,
+    then articles are pulled into the feed on read.
+    """
+    followers = (
+        select(Follow.id)
+        .where(Follow.author == author)
+        .limit(config.FEED_FANOUT_THRESHOLD + 1)
+    )
+    return (
+        select(func.count()).select_from(followers.subquery()).scalar_subquery()
+        <= config.FEED_FANOUT_THRESHOLD
+    )
+
+
+async def push_article(db: AsyncSession, article: Article):
+    """
+    Add the article to the feeds of all followers of its author.
+    The function does not return anything.
+    """
+    await db.execute(
+        insert(FeedItem)
+        .from_select(
+            ["user", "article_id", "created_at"],
+            select(
+                Follow.user,
+                cast(article.id, Integer),
+                cast(article.created_at, DateTime),
+            ).where(Follow.author == article.author),
+        )
+        .on_conflict_do_nothing()
+    )
+
+
+async def push_articles(db: AsyncSession, ids: List[int]):
+    """
+    Add the articles by ids to the feeds of all followers of their authors
+    with one statement.
+    The function does not return anything.
+    """
+    await db.execute(
+        insert(FeedItem)
+        .from_select(
+            ["user", "article_id", "created_at"],
+            select(Follow.user, Article.id, Article.created_at)
+            .join(Follow, Follow.author == Article.author)
+            .where(Article.id.in_(ids)),
+        )
+        .on_conflict_do_nothing()
+    )
+
+
+async def backfill_feed(db: AsyncSession, user_username: str, author_username: str):
+    """
+    Add the latest articles of a followed author to the user feed,
+    at most FEED_BACKFILL_LIMIT.
+    If the author has more fanned out articles, the newest one left out
+    is saved in the Follow row as the horizon of the backfill.
+    The function does not return anything.
+    """
+    articles = (
+        select(Article.id, Article.created_at)
+        .where(Article.author == author_username, Article.fanned_out.is_(True))
+        .order_by(Article.created_at.desc(), Article.id.desc())
+    )
+    latest = articles.limit(config.FEED_BACKFILL_LIMIT).subquery()
+    await db.execute(
+        insert(FeedItem)
+        .from_select(
+            ["user", "article_id", "created_at"],
+            select(cast(user_username, String), latest.c.id, latest.c.created_at),
+        )
+        .on_conflict_do_nothing()
+    )
+    horizon = articles.offset(config.FEED_BACKFILL_LIMIT).limit(1)
+    await db.execute(
+        update(Follow)
+        .where(Follow.user == user_username, Follow.author == author_username)
+        .values(
+            horizon_created_at=horizon.with_only_columns(
+                Article.created_at
+            ).scalar_subquery(),
+            horizon_article_id=horizon.with_only_columns(Article.id).scalar_subquery(),
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def trim_feed(db: AsyncSession, user_username: str, author_username: str):
+    """
+    Remove articles of an unfollowed author from the user feed.
+    The function does not return anything.
+    """
+    await db.execute(
+        delete(FeedItem)
+        .where(
+            FeedItem.user == user_username,
+            FeedItem.article_id.in_(
+                select(Article.id).where(Article.author == author_username)
+            ),
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+
+def select_feed_ids(
+    user: User,
+    limit: Optional[int] = 20,
+    offset: Optional[int] = 0,
+    cursor: Optional[Tuple[datetime, int]] = None,
+) -> Select:
+    """
+    Query of article ids for a page of the user feed.
+
+    Articles pushed into "feed_items" are read by one range scan,
+    merged with articles of followed authors that were not fanned out
+    and with articles below the backfill horizon of the follows.
+    """
+    pushed = select(FeedItem.article_id.label("id"), FeedItem.created_at).where(
+        FeedItem.user == user.username
+    )
+    pulled = (
+        select(Article.id, Article.created_at)
+        .join(Follow, Follow.author == Article.author)
+        .where(Follow.user == user.username, Article.fanned_out.is_(False))
+    )
+    older = (
+        select(Article.id, Article.created_at)
+        .join(Follow, Follow.author == Article.author)
+        .where(
+            Follow.user == user.username,
+            Follow.horizon_created_at.isnot(None),
+            Article.fanned_out.is_(True),
+            tuple_(Article.created_at, Article.id)
+            <= tuple_(Follow.horizon_created_at, Follow.horizon_article_id),
+        )
+    )
+    if cursor:
+        pushed = pushed.where(tuple_(FeedItem.created_at, FeedItem.article_id) < cursor)
+        pulled = pulled.where(tuple_(Article.created_at, Article.id) < cursor)
+        older = older.where(tuple_(Article.created_at, Article.id) < cursor)
+    window = limit + offset if limit is not None else None
+    pushed = pushed.order_by(
+        FeedItem.created_at.desc(), FeedItem.article_id.desc()
+    ).limit(window)
+    pulled = pulled.order_by(Article.created_at.desc(), Article.id.desc()).limit(window)
+    older = older.order_by(Article.created_at.desc(), Article.id.desc()).limit(window)
+
+    page = union(pushed, pulled, older).subquery()
+    return (
+        select(page.c.id)
+        .order_by(page.c.created_at.desc(), page.c.id.desc())
+        .offset(offset)
+        .limit(limit)
+    )
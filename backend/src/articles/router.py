@@ -1,55 +1,99 @@
-from typing import Optional
+from datetime import datetime
+from typing import Optional, Tuple, Union
 
+import orjson
+from aioredis import Redis
 from fastapi import HTTPException, Request, status
 from fastapi.params import Depends
-from slugify.slugify import slugify
+from pydantic import ValidationError
 from sqlalchemy.ext.asyncio import AsyncSession
-from starlette.responses import Response
+from starlette.responses import Response, StreamingResponse
 
+from settings import config
 from src.articles import utils
+from src.conditional import (
+    http_date,
+    is_not_modified,
+    make_etag,
+    not_modified,
+    viewer_names,
+)
 from src.db import models
-from src.db.database import get_db
-from src.router_setting import APIRouter
+from src.db.database import get_db, get_db_read, get_request_user_id
+from src.db.redis import get_redis
+from src.router_setting import APIRouter, FastJSONRoute
 from src.users import authorize
 from src.users.crud import get_curr_user_by_token, get_user_by_token
 
 from . import crud, schemas
 
-router_article = APIRouter()
+router_article = APIRouter(route_class=FastJSONRoute)
+
+
+def set_last_modified(response: Response, articles: list):
+    """
+    Set "Last-Modified" header by the newest article of the list.
+    """
+    if articles:
+        newest = max(article.updatedAt for article in articles)
+        response.headers["Last-Modified"] = http_date(newest)
 
 
 @router_article.get(
-    "/articles/feed", response_model=schemas.GetArticles, tags=["Articles"]
+    "/articles/feed",
+    response_model=Union[schemas.GetArticles, schemas.GetArticlesSummary],
+    tags=["Articles"],
 )
 async def get_recent_articles_from_users_you_follow(
+    response: Response,
     limit: Optional[int] = 20,
     offset: Optional[int] = 0,
+    view: schemas.ArticleView = schemas.ArticleView.full,
+    cursor: Optional[Tuple[datetime, int]] = Depends(utils.get_cursor),
     db: AsyncSession = Depends(get_db),
     user: models.User = Depends(get_curr_user_by_token),
 ):
     """
     Get most recent articles from users you follow.
     Use query parameters to limit.
+    Use "nextCursor" from the response as "cursor" to get the next page.
+    Use "view=summary" to get articles without body.
 
     Auth is required
     """
-    articles = await crud.feed_article(db, user, limit, offset)
-    return schemas.GetArticles(articles=articles, articlesCount=len(articles))
+    summary = view == schemas.ArticleView.summary
+    articles = await crud.feed_article(db, user, limit, offset, cursor, summary)
+    set_last_modified(response, articles)
+    response_schema = schemas.GetArticlesSummary if summary else schemas.GetArticles
+    return response_schema(
+        articles=articles,
+        articlesCount=len(articles),
+        nextCursor=utils.get_next_cursor(articles, limit),
+    )
 
 
-@router_article.get("/articles", response_model=schemas.GetArticles, tags=["Articles"])
+@router_article.get(
+    "/articles",
+    response_model=Union[schemas.GetArticles, schemas.GetArticlesSummary],
+    tags=["Articles"],
+)
 async def get_articles(
     request: Request,
+    response: Response,
     tag: Optional[str] = None,
     author: Optional[str] = None,
     favorited: Optional[str] = None,
     limit: Optional[int] = 20,
     offset: Optional[int] = 0,
-    db: AsyncSession = Depends(get_db),
+    view: schemas.ArticleView = schemas.ArticleView.full,
+    cursor: Optional[Tuple[datetime, int]] = Depends(utils.get_cursor),
+    db: AsyncSession = Depends(get_db_read),
 ):
     """
     Get most recent articles globally.
     Use query parameters to filter results.
+    Use "nextCursor" from the response as "cursor" to get the next page.
+    Use "view=summary" to get articles without body.
 
     Auth is optional.
     """
@@ -57,10 +101,52 @@ async def get_articles(
     if authorization:
         token = authorize.clear_token(authorization)
         authorization = await get_user_by_token(db, token)
+    summary = view == schemas.ArticleView.summary
     articles = await crud.get_articles_auth_or_not(
-        db, tag, author, favorited, limit, offset, authorization
+        db, tag, author, favorited, limit, offset, authorization, cursor, summary
+    )
+    set_last_modified(response, articles)
+    response_schema = schemas.GetArticlesSummary if summary else schemas.GetArticles
+    return response_schema(
+        articles=articles,
+        articlesCount=len(articles),
+        nextCursor=utils.get_next_cursor(articles, limit),
+    )
+
+
+@router_article.get(
+    "/articles/search",
+    response_model=Union[schemas.GetArticles, schemas.GetArticlesSummary],
+    tags=["Articles"],
+)
+async def search_articles(
+    request: Request,
+    q: str,
+    limit: Optional[int] = 20,
+    view: schemas.ArticleView = schemas.ArticleView.full,
+    cursor: Optional[Tuple[float, int]] = Depends(utils.get_search_cursor),
+    db: AsyncSession = Depends(get_db_read),
+):
+    """
+    Search articles by title, description and body,
+    the most relevant articles first.
+    Use "nextCursor" from the response as "cursor" to get the next page.
+    Use "view=summary" to get articles without body.
+
+    Auth is optional.
+    """
+    authorization = request.headers.get("Authorization")
+    if authorization:
+        token = authorize.clear_token(authorization)
+        authorization = await get_user_by_token(db, token)
+    summary = view == schemas.ArticleView.summary
+    articles = await crud.search_articles(db, q, limit, authorization, cursor, summary)
+    response_schema = schemas.GetArticlesSummary if summary else schemas.GetArticles
+    return response_schema(
+        articles=articles,
+        articlesCount=len(articles),
+        nextCursor=utils.get_next_search_cursor(articles, limit),
     )
-    return schemas.GetArticles(articles=articles, articlesCount=len(articles))
 
 
 @router_article.post(
@@ -72,39 +158,102 @@ async def get_articles(
 async def set_up_article(
     article_data: schemas.CreateArticleRequest,
     db: AsyncSession = Depends(get_db),
+    redis: Redis = Depends(get_redis),
     user: models.User = Depends(get_curr_user_by_token),
 ):
     """
     Create an article.
     Auth is required.
     """
-    slug = slugify(article_data.article.title)
-    article = await utils.get_article(db, slug)
-    if article:
+    article = await crud.create_article(db, redis, article_data, user)
+    if not article:
         raise HTTPException(
             status_code=400, detail="An article with this title already exists."
         )
-    article = await crud.create_article(db, article_data, user)
     return schemas.CreateArticleResponse(article=article)
 
 
+@router_article.post(
+    "/articles/import",
+    response_class=StreamingResponse,
+    tags=["Articles"],
+)
+async def import_articles(
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    redis: Redis = Depends(get_redis),
+    user: models.User = Depends(get_curr_user_by_token),
+):
+    """
+    Import articles of the user from NDJSON body,
+    each line is a body of "Create an article" request.
+    Every line gets a result line with its number and status:
+    "created", "exists" if an article with the title exists,
+    "invalid" with the validation errors
+    or "error" if the batch of the line failed in the database.
+    Auth is required.
+    """
+
+    async def results():
+        batch = []
+        async for number, line in utils.read_ndjson(request.stream()):
+            try:
+                data = schemas.ImportArticleRequest.parse_raw(line)
+            except ValidationError as error:
+                result = {"line": number, "status": "invalid", "detail": error.errors()}
+                yield orjson.dumps(result) + b"\n"
+                continue
+            batch.append((number, data.article))
+            if len(batch) >= config.IMPORT_BATCH_SIZE:
+                for result in await crud.import_articles(db, redis, batch, user):
+                    yield orjson.dumps(result) + b"\n"
+                batch = []
+        if batch:
+            for result in await crud.import_articles(db, redis, batch, user):
+                yield orjson.dumps(result) + b"\n"
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+
 @router_article.get(
     "/articles/{slug}", response_model=schemas.GetArticle, tags=["Articles"]
 )
-async def get_article(request: Request, slug: str, db: AsyncSession = Depends(get_db)):
+async def get_article(
+    request: Request,
+    response: Response,
+    slug: str,
+    db: AsyncSession = Depends(get_db_read),
+    redis: Redis = Depends(get_redis),
+):
     """
     Get an article.
+    Returns 304 without a database query if "If-None-Match" matches the ETag
+    and the author of the article is cached.
     Auth not required.
     """
-    article = await utils.get_article(db, slug)
-
-    if not article:
+    user_id = get_request_user_id(request)
+    author = await crud.get_article_author(db, redis, slug)
+    if author is None:
         raise HTTPException(status_code=400, detail="Artcile is not found")
+    etag = await make_etag(
+        redis,
+        [slug, user_id],
+        f"article:{slug}",
+        f"profile:{author}",
+        *viewer_names(user_id),
+    )
+    if is_not_modified(request, etag):
+        return not_modified(etag)
     authorization = request.headers.get("authorization")
     if authorization:
         token = authorize.clear_token(authorization)
         authorization = await get_user_by_token(db, token)
-    article = await crud.get_single_article_auth_or_not_auth(db, slug, authorization)
+    article = await crud.get_single_article_auth_or_not_auth(
+        db, redis, slug, authorization, author
+    )
+    if not article:
+        raise HTTPException(status_code=400, detail="Artcile is not found")
+    response.headers["ETag"] = etag
     return schemas.GetArticle(article=article)
 
 
@@ -115,21 +264,22 @@ async def change_article(
     article_data: schemas.UpdateArticle,
     slug: str,
     db: AsyncSession = Depends(get_db),
+    redis: Redis = Depends(get_redis),
     user: models.User = Depends(get_curr_user_by_token),
 ):
     """
     Update an article.
     Auth is required.
     """
-    article = await utils.get_article(db, slug)
+    article = await crud.get_single_article_auth_or_not_auth(db, redis, slug)
     if not article:
         raise HTTPException(status_code=400, detail="Artcile is not found")
-    if article.author != user.username:
+    if article.author.username != user.username:
         raise HTTPException(
             status_code=400, detail="You are not the author of this article"
         )
-    await crud.change_article(db, slug, article_data, user)
-    article = await crud.get_single_article_auth_or_not_auth(db, slug)
+    await crud.change_article(db, redis, slug, article_data, user)
+    article = await crud.get_single_article_auth_or_not_auth(db, redis, slug)
     return schemas.GetArticle(article=article)
 
 
@@ -137,20 +287,21 @@ async def change_article(
 async def remove_article(
     slug: str,
     db: AsyncSession = Depends(get_db),
+    redis: Redis = Depends(get_redis),
     user: models.User = Depends(get_curr_user_by_token),
 ):
     """
     Delete an article.
     Auth is required.
     """
-    article = await utils.get_article(db, slug)
+    article = await crud.get_single_article_auth_or_not_auth(db, redis, slug)
     if not article:
         raise HTTPException(status_code=400, detail="Artcile is not found")
-    if article.author != user.username:
+    if article.author.username != user.username:
         raise HTTPException(
             status_code=400, detail="You can not delete someone elses article"
         )
-    await crud.delete_article(db, slug)
+    await crud.delete_article(db, redis, slug)
     return Response(status_code=status.HTTP_200_OK)
 
 
@@ -160,21 +311,32 @@ async def remove_article(
     tags=["Comments"],
 )
 async def select_comment(
-    request: Request, slug: str, db: AsyncSession = Depends(get_db)
+    request: Request,
+    slug: str,
+    limit: Optional[int] = 20,
+    cursor: Optional[Tuple[datetime, int]] = Depends(utils.get_cursor),
+    db: AsyncSession = Depends(get_db_read),
 ):
     """
     Get the comments for an article.
+    Use query parameters to limit.
+    Use "nextCursor" from the response as "cursor" to get the next page.
+
     Auth is optional.
     """
-    article = await utils.get_article(db, slug)
-    if not article:
+    comments_count = await crud.count_comments(db, slug)
+    if comments_count is None:
         raise HTTPException(status_code=400, detail="Article is not found")
     authorization = request.headers.get("authorization")
     if authorization:
         token = authorize.clear_token(authorization)
         authorization = await get_user_by_token(db, token)
-    comments = await crud.get_comments(db, slug, authorization)
-    return schemas.GetCommentsResponse(comments=comments)
+    comments = await crud.get_comments(db, slug, authorization, limit, cursor)
+    return schemas.GetCommentsResponse(
+        comments=comments,
+        commentsCount=comments_count,
+        nextCursor=utils.get_next_cursor(comments, limit),
+    )
 
 
 @router_article.post(
@@ -186,6 +348,7 @@ async def post_comment(
     slug: str,
     comment: schemas.CreateComment,
     db: AsyncSession = Depends(get_db),
+    redis: Redis = Depends(get_redis),
     user: models.User = Depends(get_curr_user_by_token),
 ):
     """
@@ -195,7 +358,7 @@ async def post_comment(
     article = await utils.get_article(db, slug)
     if not article:
         raise HTTPException(status_code=400, detail="Article is not found")
-    comment = await crud.create_comment(db, comment, slug, user)
+    comment = await crud.create_comment(db, redis, comment, slug, user)
     return schemas.GetCommentResponse(comment=comment)
 
 
@@ -204,6 +367,7 @@ async def remove_comment(
     slug: str,
     id: int,
     db: AsyncSession = Depends(get_db),
+    redis: Redis = Depends(get_redis),
     user: models.User = Depends(get_curr_user_by_token),
 ):
     """
@@ -220,7 +384,7 @@ async def remove_comment(
         raise HTTPException(
             status_code=400, detail="You can only delete your own comment."
         )
-    await crud.delete_comment(db, slug, id, user)
+    await crud.delete_comment(db, redis, slug, id, user)
     return Response(status_code=status.HTTP_200_OK)
 
 
@@ -232,23 +396,22 @@ async def remove_comment(
 async def post_favorite(
     slug: str,
     db: AsyncSession = Depends(get_db),
+    redis: Redis = Depends(get_redis),
     user: models.User = Depends(get_curr_user_by_token),
 ):
     """
     Favorite an article.
     Auth is required.
     """
-    article = await utils.get_article(db, slug)
-    if not article:
-        raise HTTPException(status_code=400, detail="Article is not found")
-    favorite = await utils.check_favorite(db, slug, user.username)
-    if favorite:
+    favorite = await crud.create_favorite(db, redis, slug, user)
+    if not favorite:
+        if not await utils.get_article(db, slug):
+            raise HTTPException(status_code=400, detail="Article is not found")
         raise HTTPException(
             status_code=400,
             detail="You have already added this article to your favorites",
         )
-    await crud.create_favorite(db, slug, user)
-    article = await crud.get_single_article_auth_or_not_auth(db, slug, user)
+    article = await crud.get_single_article_auth_or_not_auth(db, redis, slug, user)
     return schemas.CreateArticleResponse(article=article)
 
 
@@ -260,13 +423,14 @@ async def post_favorite(
 async def remove_favorite(
     slug: str,
     db: AsyncSession = Depends(get_db),
+    redis: Redis = Depends(get_redis),
     user: models.User = Depends(get_curr_user_by_token),
 ):
     """
     Unfavorite an article.
     Auth is required.
     """
-    article = await utils.get_article(db, slug)
+    article = await crud.get_single_article_auth_or_not_auth(db, redis, slug)
     if not article:
         raise HTTPException(status_code=400, detail="Article is not found")
     favorite = await utils.check_favorite(db, slug, user.username)
@@ -274,16 +438,26 @@ async def remove_favorite(
         raise HTTPException(
             status_code=400, detail="The article was not in my favorites"
         )
-    await crud.delete_favorite(db, slug, user)
-    article = await crud.get_single_article_auth_or_not_auth(db, slug, user)
+    await crud.delete_favorite(db, redis, slug, user)
+    article = await crud.get_single_article_auth_or_not_auth(db, redis, slug, user)
     return schemas.CreateArticleResponse(article=article)
 
 
 @router_article.get("/tags", response_model=schemas.GetTags, tags=["Tags"])
-async def get_tags(db: AsyncSession = Depends(get_db)):
+async def get_tags(
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_db_read),
+    redis: Redis = Depends(get_redis),
+):
     """
     Get tags.
+    Returns 304 without a database query if "If-None-Match" matches the ETag.
     Auth not required.
     """
+    etag = await make_etag(redis, ["tags"], "tags")
+    if is_not_modified(request, etag):
+        return not_modified(etag)
     tags = await crud.select_tags(db)
+    response.headers["ETag"] = etag
     return schemas.GetTags(tags=tags)
@@ -1,7 +1,9 @@
 from datetime import datetime
+from enum import Enum
 from typing import List, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, constr, validator
+from slugify import slugify
 
 from src.users.schemas import ProfileUser
 
@@ -10,11 +12,15 @@ def convert_datetime_to_iso_8601(datetime: datetime) -> str:
     return datetime.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
 
 
-class Article(BaseModel):
+class ArticleView(str, Enum):
+    full = "full"
+    summary = "summary"
+
+
+class ArticleSummary(BaseModel):
     slug: str
     title: str
     description: str
-    body: str
     tagList: Optional[List[str]] = []
     createdAt: datetime
     updatedAt: datetime
@@ -27,15 +33,24 @@ class Article(BaseModel):
         json_encoders = {datetime: convert_datetime_to_iso_8601}
 
 
+class Article(ArticleSummary):
+    body: str
+
+
 class GetArticles(BaseModel):
     articles: List[Article]
     articlesCount: Optional[int] = 0
+    nextCursor: Optional[str] = None
 
     class Config:
         orm_mode = True
         json_encoders = {datetime: convert_datetime_to_iso_8601}
 
 
+class GetArticlesSummary(GetArticles):
+    articles: List[ArticleSummary]
+
+
 class CreateArticle(BaseModel):
     title: str
     description: str
@@ -47,6 +62,26 @@ class CreateArticleRequest(BaseModel):
     article: CreateArticle
 
 
+class ImportArticle(CreateArticle):
+    """
+    Article of the import, lengths are checked against the columns.
+    """
+
+    title: constr(max_length=100)
+    tagList: Optional[List[constr(max_length=50)]] = None
+
+    @validator("title")
+    def check_slug(cls, title: str) -> str:
+        slug = slugify(title)
+        if not slug or len(slug) > 100:
+            raise ValueError("the slug of the title must be 1-100 characters")
+        return title
+
+
+class ImportArticleRequest(BaseModel):
+    article: ImportArticle
+
+
 class CreateArticleResponse(BaseModel):
     article: Article
 
@@ -66,6 +101,7 @@ class ChangeArticle(BaseModel):
     title: Optional[str] = None
     description: Optional[str] = None
     body: Optional[str] = None
+    tagList: Optional[List[str]] = None
 
 
 class UpdateArticle(BaseModel):
@@ -86,6 +122,8 @@ class Comment(BaseModel):
 
 class GetCommentsResponse(BaseModel):
     comments: List[Comment]
+    commentsCount: Optional[int] = 0
+    nextCursor: Optional[str] = None
 
     class Config:
         json_encoders = {datetime: convert_datetime_to_iso_8601}
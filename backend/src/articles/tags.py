@@ -0,0 +1,63 @@
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from settings import config
+from src.db.models import Tag
+
+
+class TagCache:
+    """
+    Bounded LRU cache of tag ids by tag name.
+    Tags are never deleted, so the ids are kept until evicted.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._tags: "OrderedDict[str, int]" = OrderedDict()
+
+    def get(self, name: str) -> Optional[int]:
+        tag_id = self._tags.get(name)
+        if tag_id is not None:
+            self._tags.move_to_end(name)
+        return tag_id
+
+    def update(self, tags: Dict[str, int]):
+        for name, tag_id in tags.items():
+            self._tags[name] = tag_id
+            self._tags.move_to_end(name)
+        while len(self._tags) > self.maxsize:
+            self._tags.popitem(last=False)
+
+    def clear(self):
+        self._tags.clear()
+
+
+tag_cache = TagCache(config.TAG_CACHE_SIZE)
+
+
+async def upsert_tags(db: AsyncSession, names: Iterable[str]) -> Dict[str, int]:
+    """
+    Create missing tags by one statement and get ids of all tags by name.
+    Tags known to the cache are not sent to the database, the ids of
+    existing tags unknown to the cache are read by the second query.
+    The cache is not updated, the caller updates it after the commit.
+    """
+    tags = {name: tag_cache.get(name) for name in names if name}
+    unknown = [name for name, tag_id in tags.items() if tag_id is None]
+    if unknown:
+        stmt = await db.execute(
+            insert(Tag)
+            .values([{"name": name} for name in sorted(unknown)])
+            .on_conflict_do_nothing(index_elements=["name"])
+            .returning(Tag.name, Tag.id)
+        )
+        tags.update(stmt.all())
+    existing = [name for name, tag_id in tags.items() if tag_id is None]
+    if existing:
+        stmt = await db.execute(select(Tag.name, Tag.id).where(Tag.name.in_(existing)))
+        tags.update(stmt.all())
+    return tags
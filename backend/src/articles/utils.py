@@ -1,10 +1,25 @@
-from typing import List
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+from typing import Any, AsyncIterator, List, Mapping, Optional, Tuple
 
+import orjson
+from aioredis import Redis
+from aioredis.client import Pipeline
+from aioredis.exceptions import WatchError
+from fastapi import HTTPException
 from settings import config
-from sqlalchemy import func
+from sqlalchemy import false, tuple_
+from sqlalchemy.dialects.postgresql import array_agg
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from src.db.models import Article, Favorite, User
+from sqlalchemy.orm import aliased
+from sqlalchemy.sql import Select
+from src.conditional import get_versions
+from src.db.database import is_replica
+from src.db.models import Article, Favorite, Follow, User, article_tag_table
+
+# Marks a favorites set loaded from the database, slugs never contain ":".
+FAVORITES_LOADED = ":loaded"
 
 
 async def check_favorite(db: AsyncSession, slug: str, username: str) -> bool:
@@ -18,62 +33,78 @@ async def check_favorite(db: AsyncSession, slug: str, username: str) -> bool:
     return True if favorite else False
 
 
-async def add_favorited(
-    db: AsyncSession, articles: List[Article], current_user: User
-) -> List[Article]:
+def favorites_key(username: str) -> str:
     """
-    Change field "favorited" in Article pydantic model for articles.
-    If there is authorizatrion.
+    Redis key of the set of article slugs favorited by the user.
     """
-    favorites_user_article = await config.redis_db.hgetall("favorites")
-    if not favorites_user_article:
+    return f"favorites:{username}"
 
-        stmt = await db.execute(
-            select(Favorite).where(Favorite.user == current_user.username)
-        )
-        favorites_user = stmt.scalars().all()
-        await db.close()
 
-        favorites_user_article = {
-            favorite.article: favorite.user for favorite in favorites_user
-        }
-        for article, user in favorites_user_article.items():
-            await config.redis_db.hset("favorites", article, user)
+def favorites_generation_key(username: str) -> str:
+    """
+    Redis key of the counter of favorites changes of the user.
+    """
+    return f"favorites_generation:{username}"
+
 
-    for article in articles:
-        if article.slug in favorites_user_article:
-            article.favorited = True
-    return articles
+def change_favorites(pipe: Pipeline, username: str, slug: str, favorited: bool):
+    """
+    Add the commands changing the favorites set of the user to the pipeline
+    and increase the generation, so that a set read from the database before
+    the change is not stored.
+    """
+    key = favorites_key(username)
+    if favorited:
+        pipe.sadd(key, slug)
+    else:
+        pipe.srem(key, slug)
+    pipe.expire(key, config.REDIS_CACHE_TTL)
+    pipe.incr(favorites_generation_key(username))
+    pipe.expire(favorites_generation_key(username), config.REDIS_CACHE_TTL)
 
 
-async def add_tags_authors_favorites_time_in_articles(
-    db: AsyncSession, articles: List[Article]
+async def add_favorited(
+    db: AsyncSession, redis: Redis, articles: List[Article], current_user: User
 ) -> List[Article]:
     """
-    Add tags, authors, created and updated time
-    in articles for Article pydantic model.
+    Change field "favorited" in Article pydantic model for articles.
+    If there is authorizatrion.
+
+    Only slugs of the given articles are checked in the user favorites set
+    in one round trip. The set is loaded from the database on a miss
+    and stored only if the generation of the favorites is unchanged
+    and the session does not read from a replica.
     """
-    count_favorite_articles = await config.redis_db.hgetall("count_favorites")
-    if not count_favorite_articles:
+    key = favorites_key(current_user.username)
+    generation_key = favorites_generation_key(current_user.username)
+    pipe = redis.pipeline(transaction=False)
+    pipe.get(generation_key)
+    pipe.sismember(key, FAVORITES_LOADED)
+    for article in articles:
+        pipe.sismember(key, article.slug)
+    generation, loaded, *favorited = await pipe.execute()
+
+    if not loaded:
         stmt = await db.execute(
-            select(Favorite.article, func.count(Favorite.article)).group_by(
-                Favorite.article
-            )
+            select(Favorite.article).where(Favorite.user == current_user.username)
         )
-        favorites = stmt.all()
+        favorites_user = set(stmt.scalars().all())
         await db.close()
-        count_favorite_articles = {article[0]: article[1] for article in favorites}
-        for article, count in count_favorite_articles.items():
-            await config.redis_db.hset("count_favorites", article, count)
+        favorited = [article.slug in favorites_user for article in articles]
+        if not is_replica(db):
+            async with redis.pipeline(transaction=True) as pipe:
+                try:
+                    await pipe.watch(generation_key)
+                    if await pipe.get(generation_key) == generation:
+                        pipe.multi()
+                        pipe.sadd(key, FAVORITES_LOADED, *favorites_user)
+                        pipe.expire(key, config.REDIS_CACHE_TTL)
+                        await pipe.execute()
+                except WatchError:
+                    pass
 
-    for article in articles:
-        if not isinstance(article.author, User):
-            article.author = article.authors
-        article.tagList = [tag.name for tag in article.tag]
-        if article.slug in count_favorite_articles:
-            article.favoritesCount = count_favorite_articles[article.slug]
-        article.createdAt = article.created_at
-        article.updatedAt = article.updated_at
+    for article, is_favorited in zip(articles, favorited):
+        article.favorited = bool(is_favorited)
     return articles
 
 
@@ -84,3 +115,274 @@ async def get_article(db: AsyncSession, slug: str) -> Article:
     stmt = await db.execute(select(Article).filter(Article.slug == slug))
     article = stmt.scalars().first()
     return article
+
+
+class AuthorRow:
+    """
+    Author fields of ProfileUser pydantic model.
+    """
+
+    __slots__ = ("username", "bio", "image", "following")
+
+    def __init__(self, username: str, bio: str, image: str, following: bool = False):
+        self.username = username
+        self.bio = bio
+        self.image = image
+        self.following = following
+
+
+class ArticleRow:
+    """
+    Article fields of Article pydantic model, with id and search rank
+    for the cursor.
+    """
+
+    __slots__ = (
+        "id",
+        "slug",
+        "title",
+        "description",
+        "body",
+        "tagList",
+        "createdAt",
+        "updatedAt",
+        "favorited",
+        "favoritesCount",
+        "author",
+        "rank",
+    )
+
+    def __init__(self, row: Mapping[str, Any]):
+        self.id = row["id"]
+        self.slug = row["slug"]
+        self.title = row["title"]
+        self.description = row["description"]
+        self.body = row.get("body")
+        self.tagList = row["tag_list"] or []
+        self.createdAt = row["created_at"]
+        self.updatedAt = row["updated_at"]
+        self.favorited = row.get("favorited", False)
+        self.favoritesCount = row["favorites_count"]
+        self.author = AuthorRow(
+            row["author_username"],
+            row["author_bio"],
+            row["author_image"],
+            row.get("following", False),
+        )
+        self.rank = row.get("rank")
+
+
+def select_articles(
+    current_user: Optional[User] = None, summary: bool = False
+) -> Select:
+    """
+    Query of the columns of articles and their authors,
+    with tagList, favorited and following computed in SQL.
+    favoritesCount is read from the counter column of the article.
+    The body column is not selected for the summary.
+
+    Filtering, ordering and pagination are added by the caller.
+    """
+    favorite = aliased(Favorite)
+    follow = aliased(Follow)
+    tag_list = (
+        select(array_agg(article_tag_table.c.tags_name))
+        .where(article_tag_table.c.article_id == Article.id)
+        .correlate(Article)
+        .scalar_subquery()
+    )
+    if current_user:
+        favorited = (
+            select(favorite.id)
+            .where(
+                favorite.article == Article.slug,
+                favorite.user == current_user.username,
+            )
+            .correlate(Article)
+            .exists()
+        )
+        following = (
+            select(follow.id)
+            .where(
+                follow.author == Article.author,
+                follow.user == current_user.username,
+            )
+            .correlate(Article)
+            .exists()
+        )
+    else:
+        favorited = following = false()
+
+    columns = [Article.id, Article.slug, Article.title, Article.description]
+    if not summary:
+        columns.append(Article.body)
+    return select(
+        *columns,
+        Article.created_at,
+        Article.updated_at,
+        User.username.label("author_username"),
+        User.bio.label("author_bio"),
+        User.image.label("author_image"),
+        tag_list.label("tag_list"),
+        Article.favorites_count,
+        favorited.label("favorited"),
+        following.label("following"),
+    ).join_from(Article, User, Article.author == User.username)
+
+
+async def get_list_articles(db: AsyncSession, query: Select) -> List[ArticleRow]:
+    """
+    Execute a query built by select_articles
+    and map the rows for Article pydantic model.
+
+    The articles are read with one query without ORM entities.
+    """
+    stmt = await db.execute(query)
+    rows = stmt.all()
+    await db.close()
+    return [ArticleRow(row._mapping) for row in rows]
+
+
+def article_key(slug: str, version: str, profile_version: str) -> str:
+    """
+    Redis key of the article fields that do not depend on the user.
+    The key holds the versions of the article and of its author profile,
+    so a row read before a write is cached under a replaced version
+    and is never read.
+    """
+    return f"article:{slug}:{version}:{profile_version}"
+
+
+def article_author_key(slug: str) -> str:
+    """
+    Redis key of the username of the article author.
+    The author of an article never changes.
+    """
+    return f"article_author:{slug}"
+
+
+async def get_article_key(redis: Redis, slug: str, author: str) -> str:
+    """
+    Redis key of the article by the current versions.
+    Must be taken before the article is read from the database.
+    """
+    versions = await get_versions(redis, f"article:{slug}", f"profile:{author}")
+    return article_key(slug, *versions)
+
+
+async def cache_article(redis: Redis, key: str, row: Mapping[str, Any]):
+    """
+    Cache a row of select_articles without the flags of the user.
+    """
+    article = {
+        name: value
+        for name, value in row.items()
+        if name not in ("favorited", "following")
+    }
+    await redis.set(
+        key,
+        orjson.dumps(article).decode(),
+        ex=config.REDIS_CACHE_TTL,
+    )
+
+
+def load_article(cached: str) -> ArticleRow:
+    """
+    Article from the cache, the flags of the user are not set.
+    """
+    article = orjson.loads(cached)
+    article["created_at"] = datetime.fromisoformat(article["created_at"])
+    article["updated_at"] = datetime.fromisoformat(article["updated_at"])
+    return ArticleRow(article)
+
+
+def paginate_articles(
+    query: Select,
+    limit: Optional[int] = 20,
+    offset: Optional[int] = 0,
+    cursor: Optional[Tuple[datetime, int]] = None,
+) -> Select:
+    """
+    Order articles from newest to oldest by (created_at, id)
+    and seek past the cursor if it is given.
+
+    The seek predicate uses the same key as the ordering,
+    so a late page costs the same as the first one.
+    """
+    if cursor:
+        query = query.where(tuple_(Article.created_at, Article.id) < cursor)
+    return (
+        query.order_by(Article.created_at.desc(), Article.id.desc())
+        .offset(offset)
+        .limit(limit)
+    )
+
+
+def encode_cursor(created_at: datetime, id: int) -> str:
+    """
+    Create an opaque cursor from the sort key (created_at, id) of the last row.
+    """
+    return urlsafe_b64encode(f"{created_at.isoformat()}|{id}".encode()).decode()
+
+
+def get_cursor(cursor: Optional[str] = None) -> Optional[Tuple[datetime, int]]:
+    """
+    Decode the "cursor" query parameter into a (created_at, id) seek key.
+    Causes an exception if the cursor is invalid.
+    """
+    if cursor is None:
+        return None
+    try:
+        created_at, id = urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), int(id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def get_search_cursor(cursor: Optional[str] = None) -> Optional[Tuple[float, int]]:
+    """
+    Decode the "cursor" query parameter of the search into a (rank, id) seek key.
+    Causes an exception if the cursor is invalid.
+    """
+    if cursor is None:
+        return None
+    try:
+        rank, id = urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return float(rank), int(id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def get_next_search_cursor(rows: List, limit: Optional[int]) -> Optional[str]:
+    """
+    Search cursor of the next page or None if the page is the last one.
+    """
+    if not limit or len(rows) < limit:
+        return None
+    return urlsafe_b64encode(f"{rows[-1].rank!r}|{rows[-1].id}".encode()).decode()
+
+
+def get_next_cursor(rows: List, limit: Optional[int]) -> Optional[str]:
+    """
+    Cursor of the next page or None if the page is the last one.
+    """
+    if not limit or len(rows) < limit:
+        return None
+    return encode_cursor(rows[-1].createdAt, rows[-1].id)
+
+
+async def read_ndjson(stream: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, bytes]]:
+    """
+    Split a streamed body into NDJSON lines with their numbers,
+    blank lines are skipped.
+    """
+    number, rest = 0, b""
+    async for chunk in stream:
+        lines = (rest + chunk).split(b"\n")
+        rest = lines.pop()
+        for line in lines:
+            number += 1
+            if line.strip():
+                yield number, line
+    if rest.strip():
+        yield number + 1, rest
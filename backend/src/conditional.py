@@ -0,0 +1,89 @@
+import hashlib
+import uuid
+from datetime import datetime, timezone
+from email.utils import format_datetime
+from typing import List, Optional
+
+from aioredis import Redis
+from starlette.requests import Request
+from starlette.responses import Response
+
+from settings import config
+
+
+def version_key(name: str) -> str:
+    return f"version:{name}"
+
+
+async def get_versions(
+    redis: Redis, *names: str, create: bool = True
+) -> List[Optional[str]]:
+    """
+    Get random version tokens of the resources, missing tokens are created
+    unless create is False, then they are None.
+    """
+    keys = [version_key(name) for name in names]
+    versions = await redis.mget(keys)
+    missing = [key for key, version in zip(keys, versions) if version is None]
+    if missing and create:
+        pipe = redis.pipeline(transaction=False)
+        for key in missing:
+            pipe.set(key, uuid.uuid4().hex, ex=config.REDIS_CACHE_TTL, nx=True)
+        await pipe.execute()
+        versions = await redis.mget(keys)
+    return versions
+
+
+async def bump_versions(redis: Redis, *names: str):
+    """
+    Replace version tokens of the changed resources.
+    """
+    pipe = redis.pipeline(transaction=False)
+    for name in names:
+        pipe.set(version_key(name), uuid.uuid4().hex, ex=config.REDIS_CACHE_TTL)
+    await pipe.execute()
+
+
+async def make_etag(
+    redis: Redis, parts: List[str], *names: str, create: bool = True
+) -> Optional[str]:
+    """
+    Weak ETag from the parts and versions of the resources.
+    None if a version is missing and create is False.
+    """
+    versions = await get_versions(redis, *names, create=create)
+    if None in versions:
+        return None
+    value = ":".join([*map(str, parts), *versions])
+    return f'W/"{hashlib.sha1(value.encode()).hexdigest()}"'
+
+
+def viewer_names(user_id: Optional[int]) -> List[str]:
+    """
+    Versions of the viewer flags, empty for anonymous requests.
+    """
+    return [f"follows:{user_id}"] if user_id is not None else []
+
+
+def is_not_modified(request: Request, etag: str) -> bool:
+    """
+    Weak comparison of the ETag with "If-None-Match" header.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    tags = {tag.strip().replace("W/", "", 1) for tag in if_none_match.split(",")}
+    return etag.replace("W/", "", 1) in tags
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag})
+
+
+def http_date(value: datetime) -> str:
+    """
+    Format the local naive time of the models as HTTP date.
+    """
+    return format_datetime(value.astimezone(timezone.utc), usegmt=True)
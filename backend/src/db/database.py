@@ -1,21 +1,158 @@
-from typing import AsyncGenerator, Tuple
+from itertools import count
+from time import perf_counter
+from typing import AsyncGenerator, Dict, List, Optional, Tuple, Union
 
+from fastapi import HTTPException
+from sqlalchemy import exc
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.ext.asyncio.engine import AsyncEngine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from starlette.requests import Request
 
+from settings import config
+from src.users import authorize
 
-def create_engine_async_app(db_url: str) -> Tuple[AsyncEngine, AsyncSession]:
-    async_engine = create_async_engine(db_url, future=True, echo=True)
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """
+    Queue pool counting checkouts, time spent waiting for a connection
+    and checkouts failed by pool_timeout.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    def _do_get(self):
+        start = perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            wait_time = perf_counter() - start
+            self.checkouts += 1
+            self.wait_time += wait_time
+            self.max_wait_time = max(self.max_wait_time, wait_time)
+
+
+def create_engine_async_app(
+    db_url: str,
+    echo: bool = False,
+    pool_size: int = 5,
+    max_overflow: int = 10,
+    pool_timeout: int = 30,
+    pool_pre_ping: bool = False,
+    pool_recycle: int = -1,
+    statement_cache_size: int = 100,
+) -> Tuple[AsyncEngine, AsyncSession]:
+    """
+    Create an engine with its own connection pool and a session factory.
+    statement_cache_size is the size of the prepared statement cache
+    of each asyncpg connection, 0 disables it (e.g. behind pgbouncer).
+    """
+    async_engine = create_async_engine(
+        db_url,
+        future=True,
+        echo=echo,
+        poolclass=InstrumentedQueuePool,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=pool_timeout,
+        pool_pre_ping=pool_pre_ping,
+        pool_recycle=pool_recycle,
+        connect_args={"prepared_statement_cache_size": statement_cache_size},
+    )
     async_session = sessionmaker(
         async_engine, expire_on_commit=False, class_=AsyncSession
     )
     return async_engine, async_session
 
 
+class ReadReplicas:
+    """
+    Engines of the read replicas, a replica with the fewest checked out
+    connections is chosen, ties are broken in turn.
+    """
+
+    def __init__(self, db_urls: List[str], **options):
+        self.replicas = [create_engine_async_app(url, **options) for url in db_urls]
+        self._turn = count()
+
+    def __bool__(self):
+        return bool(self.replicas)
+
+    def choose(self) -> sessionmaker:
+        start = next(self._turn) % len(self.replicas)
+        replicas = self.replicas[start:] + self.replicas[:start]
+        _, async_session = min(
+            replicas, key=lambda replica: replica[0].pool.checkedout()
+        )
+        return async_session
+
+    def pool_stats(self) -> List[Dict[str, Union[int, float]]]:
+        return [get_db_pool_stats(engine) for engine, _ in self.replicas]
+
+    async def dispose(self):
+        for engine, _ in self.replicas:
+            await engine.dispose()
+
+
+def primary_key(user_id: int) -> str:
+    return f"primary:{user_id}"
+
+
+def get_request_user_id(request: Request) -> Optional[int]:
+    """
+    User id from the token of the request without a database query.
+    """
+    try:
+        token = authorize.clear_token(request.headers.get(config.API_KEY_NAME))
+        return authorize.decode_jwt(token).user_id
+    except HTTPException:
+        return None
+
+
+async def stick_to_primary(request: Request, user_id: int):
+    """
+    Send reads of the user to the primary for REPLICA_STICKY_SECONDS
+    in all workers, so that the user reads its own writes.
+    """
+    if request.app.state.replicas:
+        await request.app.state.redis.set(
+            primary_key(user_id), 1, ex=config.REPLICA_STICKY_SECONDS
+        )
+
+
+async def get_read_sessionmaker(request: Request) -> sessionmaker:
+    """
+    Session factory of a replica, or of the primary if there are
+    no replicas or the user of the request has written recently.
+    """
+    replicas = request.app.state.replicas
+    if not replicas:
+        return request.app.state.sessionmaker
+    user_id = get_request_user_id(request)
+    if user_id is not None and await request.app.state.redis.exists(
+        primary_key(user_id)
+    ):
+        return request.app.state.sessionmaker
+    return replicas.choose()
+
+
 async def get_db(request: Request) -> AsyncGenerator:
+    if request.app.state.replicas and request.method not in SAFE_METHODS:
+        user_id = get_request_user_id(request)
+        if user_id is not None:
+            await stick_to_primary(request, user_id)
     db = request.app.state.sessionmaker()
     try:
         yield db
@@ -24,3 +161,47 @@ async def get_db(request: Request) -> AsyncGenerator:
         raise ex
     finally:
         await db.close()
+
+
+def is_replica(db: AsyncSession) -> bool:
+    """
+    Checking that the session reads from a replica.
+    """
+    return db.sync_session.info.get("replica", False)
+
+
+async def get_db_read(request: Request) -> AsyncGenerator:
+    """
+    Session for read-only routes.
+    Reads from a replica are marked in the session and the request state.
+    """
+    async_session = await get_read_sessionmaker(request)
+    db = async_session()
+    replica = async_session is not request.app.state.sessionmaker
+    db.sync_session.info["replica"] = replica
+    if replica:
+        request.state.replica = True
+    try:
+        yield db
+    except SQLAlchemyError as ex:
+        await db.rollback()
+        raise ex
+    finally:
+        await db.close()
+
+
+def get_db_pool_stats(engine: AsyncEngine) -> Dict[str, Union[int, float]]:
+    """
+    Usage of the connection pool, wait times are in seconds.
+    """
+    pool = engine.pool
+    return {
+        "poolSize": pool.size(),
+        "checkedOutConnections": pool.checkedout(),
+        "idleConnections": pool.checkedin(),
+        "overflowConnections": max(pool.overflow(), 0),
+        "checkouts": pool.checkouts,
+        "timeouts": pool.timeouts,
+        "waitTime": pool.wait_time,
+        "maxWaitTime": pool.max_wait_time,
+    }
@@ -1,8 +1,18 @@
 from datetime import datetime
 
-from sqlalchemy import Column, ForeignKey, Integer, String, Text
+from sqlalchemy import (
+    Boolean,
+    Column,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    Text,
+    UniqueConstraint,
+)
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import backref, relationship
+from sqlalchemy.orm import backref, deferred, relationship
 from sqlalchemy.schema import Table
 from sqlalchemy.sql.sqltypes import DateTime
 
@@ -14,12 +24,14 @@ class User(Base):
     __mapper_args__ = {"eager_defaults": True}
 
     id = Column(Integer, primary_key=True)
-    token = Column(String, unique=True)
+    token_version = Column(Integer, default=0, nullable=False)
     email = Column(String(50), unique=True)
     username = Column(String(50), unique=True)
     bio = Column(Text)
     image = Column(String(250))
     password = Column(String(250))
+    followers_count = Column(Integer, default=0, server_default="0", nullable=False)
+    following_count = Column(Integer, default=0, server_default="0", nullable=False)
 
     articles = relationship(
         "Article",
@@ -48,6 +60,10 @@ class Follow(Base):
     id = Column(Integer, primary_key=True)
     user = Column(String(50), ForeignKey("users.username", ondelete="CASCADE"))
     author = Column(String(50), ForeignKey("users.username", ondelete="CASCADE"))
+    # The newest fanned out article of the author left out of the feed backfill,
+    # the articles up to it are pulled into the feed on read.
+    horizon_created_at = Column(DateTime, nullable=True)
+    horizon_article_id = Column(Integer, nullable=True)
 
     followers = relationship(
         "User",
@@ -61,6 +77,11 @@ class Follow(Base):
         backref=backref("following_user", cascade="all,delete-orphan"),
     )
 
+    __table_args__ = (
+        Index("uq_followers_user_author", user, author, unique=True),
+        Index("ix_followers_author", author, postgresql_include=["user"]),
+    )
+
     def __repr__(self):
         return f"Follow(user={self.user},author={self.author})"
 
@@ -70,6 +91,8 @@ article_tag_table = Table(
     Base.metadata,
     Column("article_id", ForeignKey("articles.id", ondelete="CASCADE")),
     Column("tags_name", ForeignKey("tags.name", ondelete="CASCADE")),
+    Index("ix_article_tag_tags_name", "tags_name", "article_id"),
+    Index("uq_article_tag_article_id", "article_id", "tags_name", unique=True),
 )
 
 
@@ -83,12 +106,35 @@ class Article(Base):
     description = Column(Text)
     body = Column(Text)
     author = Column(String(50), ForeignKey("users.username", ondelete="CASCADE"))
+    fanned_out = Column(Boolean, default=True)
+    favorites_count = Column(Integer, default=0, server_default="0", nullable=False)
+    comments_count = Column(Integer, default=0, server_default="0", nullable=False)
+    # Weighted title, description and body, kept by a database trigger.
+    search_vector = deferred(Column(TSVECTOR, nullable=True))
 
-    created_at = Column(DateTime, default=datetime.now())
+    created_at = Column(DateTime, default=datetime.now)
     updated_at = Column(
         DateTime,
-        onupdate=datetime.now(),
-        default=datetime.now(),
+        onupdate=datetime.now,
+        default=datetime.now,
+    )
+
+    __table_args__ = (
+        Index("ix_articles_created_at_id", created_at.desc(), id.desc()),
+        Index(
+            "ix_articles_author_created_at_id",
+            author,
+            created_at.desc(),
+            id.desc(),
+        ),
+        Index(
+            "ix_articles_author_created_at_pulled",
+            author,
+            created_at.desc(),
+            id.desc(),
+            postgresql_where=fanned_out.is_(False),
+        ),
+        Index("ix_articles_search_vector", search_vector, postgresql_using="gin"),
     )
 
     tag = relationship(
@@ -113,6 +159,29 @@ class Article(Base):
         return f"Article(slug={self.slug},title={self.title})"
 
 
+class FeedItem(Base):
+    __tablename__ = "feed_items"
+    __mapper_args__ = {"eager_defaults": True}
+
+    id = Column(Integer, primary_key=True)
+    user = Column(String(50), ForeignKey("users.username", ondelete="CASCADE"))
+    article_id = Column(Integer, ForeignKey("articles.id", ondelete="CASCADE"))
+    created_at = Column(DateTime)
+
+    __table_args__ = (
+        UniqueConstraint("user", "article_id"),
+        Index(
+            "ix_feed_items_user_created_at",
+            user,
+            created_at.desc(),
+            article_id.desc(),
+        ),
+    )
+
+    def __repr__(self):
+        return f"FeedItem(user={self.user},article_id={self.article_id})"
+
+
 class Tag(Base):
     __tablename__ = "tags"
     __mapper_args__ = {"eager_defaults": True}
@@ -132,6 +201,11 @@ class Favorite(Base):
     user = Column(String(50), ForeignKey("users.username", ondelete="CASCADE"))
     article = Column(String(100), ForeignKey("articles.slug", ondelete="CASCADE"))
 
+    __table_args__ = (
+        Index("uq_favorites_user_article", user, article, unique=True),
+        Index("ix_favorites_article", article),
+    )
+
     def __repr__(self):
         return f"Favorite(article={self.article},user={self.user})"
 
@@ -145,11 +219,15 @@ class Comment(Base):
     author = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"))
     article = Column(String(100), ForeignKey("articles.slug", ondelete="CASCADE"))
 
-    created_at = Column(DateTime, default=datetime.now())
+    created_at = Column(DateTime, default=datetime.now)
     updated_at = Column(
         DateTime,
-        onupdate=datetime.now(),
-        default=datetime.now(),
+        onupdate=datetime.now,
+        default=datetime.now,
+    )
+
+    __table_args__ = (
+        Index("ix_comments_article_created_at_id", article, created_at, id),
     )
 
     def __repr__(self):
@@ -0,0 +1,53 @@
+from typing import Dict
+
+from aioredis import BlockingConnectionPool, Redis
+from starlette.requests import Request
+
+
+def create_redis_async_app(
+    redis_url: str,
+    max_connections: int = 50,
+    pool_timeout: int = 5,
+    socket_timeout: int = 5,
+) -> Redis:
+    """
+    Create a Redis client with a connection pool shared by all requests.
+    When all connections are in use, a request waits for pool_timeout seconds.
+    """
+    pool = BlockingConnectionPool.from_url(
+        redis_url,
+        max_connections=max_connections,
+        timeout=pool_timeout,
+        socket_timeout=socket_timeout,
+        socket_connect_timeout=socket_timeout,
+        encoding="utf-8",
+        decode_responses=True,
+    )
+    return Redis(connection_pool=pool)
+
+
+async def close_redis(redis: Redis):
+    """
+    Close the client and all connections of the pool.
+    """
+    await redis.close()
+    await redis.connection_pool.disconnect()
+
+
+async def get_redis(request: Request) -> Redis:
+    return request.app.state.redis
+
+
+def get_redis_pool_stats(redis: Redis) -> Dict[str, int]:
+    """
+    Usage of the connection pool.
+    """
+    pool = redis.connection_pool
+    created = len(pool._connections)
+    idle = sum(1 for connection in pool.pool._queue if connection is not None)
+    return {
+        "maxConnections": pool.max_connections,
+        "createdConnections": created,
+        "inUseConnections": created - idle,
+        "idleConnections": idle,
+    }
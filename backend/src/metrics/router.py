@@ -0,0 +1,25 @@
+from fastapi import Request
+
+from src.db.database import get_db_pool_stats
+from src.db.redis import get_redis_pool_stats
+from src.router_setting import APIRouter
+from src.users.cache import user_cache
+
+from . import schemas
+
+router_metrics = APIRouter()
+
+
+@router_metrics.get("/metrics", response_model=schemas.GetMetrics, tags=["Metrics"])
+async def get_metrics(request: Request):
+    """
+    Get usage of the connection pools and caches of the worker,
+    the pools of the read replicas are in the order of DATABASE_REPLICA_URLS.
+    Auth not required.
+    """
+    return schemas.GetMetrics(
+        database=get_db_pool_stats(request.app.state.engine),
+        replicas=request.app.state.replicas.pool_stats(),
+        redis=get_redis_pool_stats(request.app.state.redis),
+        userCache=user_cache.stats(),
+    )
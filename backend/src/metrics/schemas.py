@@ -0,0 +1,35 @@
+from typing import List
+
+from pydantic import BaseModel
+
+
+class DatabasePoolStats(BaseModel):
+    poolSize: int
+    checkedOutConnections: int
+    idleConnections: int
+    overflowConnections: int
+    checkouts: int
+    timeouts: int
+    waitTime: float
+    maxWaitTime: float
+
+
+class RedisPoolStats(BaseModel):
+    maxConnections: int
+    createdConnections: int
+    inUseConnections: int
+    idleConnections: int
+
+
+class UserCacheStats(BaseModel):
+    size: int
+    maxSize: int
+    hits: int
+    misses: int
+
+
+class GetMetrics(BaseModel):
+    database: DatabasePoolStats
+    replicas: List[DatabasePoolStats]
+    redis: RedisPoolStats
+    userCache: UserCacheStats
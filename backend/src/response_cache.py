@@ -0,0 +1,227 @@
+import base64
+import gzip
+import re
+from typing import List, Optional
+from urllib.parse import parse_qsl, urlencode
+
+import brotli
+from aioredis import Redis
+from aioredis.exceptions import WatchError
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.requests import Request
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from settings import config
+from src.conditional import is_not_modified
+
+ENCODINGS = ("br", "gzip")
+
+ROUTES = [
+    (re.compile(r"^/articles/?$"), lambda match: ["articles", "authors"]),
+    (re.compile(r"^/articles/search/?$"), lambda match: ["articles", "authors"]),
+    (
+        re.compile(r"^/articles/(?!(?:feed|search)/?$)([^/]+)/?$"),
+        lambda match: [f"article:{match[1]}", "authors"],
+    ),
+    (
+        re.compile(r"^/articles/([^/]+)/comments/?$"),
+        lambda match: [f"comments:{match[1]}", "authors"],
+    ),
+    (re.compile(r"^/tags/?$"), lambda match: ["tags"]),
+]
+
+
+def response_key(path: str, query_string: bytes) -> str:
+    """
+    Key of the response by path and the query sorted by parameters.
+    """
+    query = urlencode(sorted(parse_qsl(query_string.decode("latin-1"))))
+    return f"response:{path}?{query}"
+
+
+def response_tag_key(tag: str) -> str:
+    return f"response_tag:{tag}"
+
+
+def response_generation_key(tag: str) -> str:
+    return f"response_generation:{tag}"
+
+
+def get_response_tags(path: str) -> Optional[List[str]]:
+    """
+    Invalidation tags of a cached path, None if the path is not cached.
+    """
+    for pattern, tags in ROUTES:
+        match = pattern.match(path)
+        if match:
+            return tags(match)
+    return None
+
+
+def choose_encoding(accept_encoding: str) -> str:
+    """
+    The encoding with the highest q-value of "Accept-Encoding",
+    encodings with q=0 are refused.
+    """
+    weights = {}
+    for value in accept_encoding.split(","):
+        name, *params = value.split(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        weight = 1.0
+        for param in params:
+            key, _, number = param.strip().partition("=")
+            if key.lower() == "q":
+                try:
+                    weight = float(number)
+                except ValueError:
+                    weight = 0.0
+        weights[name] = weight
+    default = weights.get("*", 0.0)
+    encoding = max(ENCODINGS, key=lambda encoding: weights.get(encoding, default))
+    if weights.get(encoding, default) > 0:
+        return encoding
+    return "identity"
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body)
+    return gzip.compress(body)
+
+
+async def invalidate_responses(redis: Redis, *tags: str):
+    """
+    Remove the cached responses marked by any of the tags
+    and increase the generations of the tags, so that responses
+    rendered before the call are not stored.
+    """
+    tag_keys = [response_tag_key(tag) for tag in tags]
+    pipe = redis.pipeline(transaction=False)
+    for tag in tags:
+        pipe.incr(response_generation_key(tag))
+        pipe.expire(response_generation_key(tag), config.RESPONSE_CACHE_TTL)
+    for tag_key in tag_keys:
+        pipe.smembers(tag_key)
+    keys = set().union(*(await pipe.execute())[2 * len(tags) :])
+    await redis.delete(*keys, *tag_keys)
+
+
+class ResponseCacheMiddleware:
+    """
+    Caches successful responses of anonymous GET requests to public
+    endpoints in Redis together with brotli and gzip variants.
+    Requests with the "Authorization" header are not cached,
+    their responses depend on the user.
+    A response is stored only if the generations of its tags are
+    unchanged since the request started and it was not read from a replica.
+    """
+
+    def __init__(self, app: ASGIApp, ttl: int = 60, max_size: int = 1024 * 1024):
+        self.app = app
+        self.ttl = ttl
+        self.max_size = max_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["method"] != "GET":
+            return await self.app(scope, receive, send)
+        headers = Headers(scope=scope)
+        tags = get_response_tags(scope["path"])
+        if tags is None or config.API_KEY_NAME in headers:
+            return await self.app(scope, receive, send)
+
+        redis = scope["app"].state.redis
+        key = response_key(scope["path"], scope["query_string"])
+        encoding = choose_encoding(headers.get("accept-encoding", ""))
+        content_type, etag, last_modified, body = await redis.hmget(
+            key, "content-type", "etag", "last-modified", encoding
+        )
+        if body is not None:
+            headers = MutableHeaders()
+            headers["vary"] = "Accept-Encoding"
+            headers["x-cache"] = "HIT"
+            if etag:
+                headers["etag"] = etag
+            if last_modified:
+                headers["last-modified"] = last_modified
+            if etag and is_not_modified(Request(scope), etag):
+                await self.send_body(send, 304, headers, b"")
+                return
+            headers["content-type"] = content_type
+            if encoding == "identity":
+                body = body.encode()
+            else:
+                headers["content-encoding"] = encoding
+                body = base64.b64decode(body)
+            await self.send_body(send, 200, headers, body)
+            return
+        await self.cache_response(scope, receive, send, redis, key, tags)
+
+    async def send_body(
+        self, send: Send, status: int, headers: MutableHeaders, body: bytes
+    ):
+        headers["content-length"] = str(len(body))
+        await send(
+            {"type": "http.response.start", "status": status, "headers": headers.raw}
+        )
+        await send({"type": "http.response.body", "body": body})
+
+    async def cache_response(
+        self,
+        scope: Scope,
+        receive: Receive,
+        send: Send,
+        redis: Redis,
+        key: str,
+        tags: List[str],
+    ):
+        start = {}
+        chunks = []
+        generation_keys = [response_generation_key(tag) for tag in tags]
+        generations = await redis.mget(generation_keys)
+
+        async def send_wrapper(message: Message):
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(raw=message["headers"])
+                headers["x-cache"] = "MISS"
+                message["headers"] = headers.raw
+                start.update(message)
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+        response_headers = Headers(raw=start.get("headers", []))
+        body = b"".join(chunks)
+        if (
+            start.get("status") != 200
+            or "content-encoding" in response_headers
+            or len(body) > self.max_size
+            or scope.get("state", {}).get("replica")
+        ):
+            return
+        variants = {
+            "content-type": response_headers.get("content-type", "application/json"),
+            "identity": body.decode(),
+        }
+        for header in ("etag", "last-modified"):
+            if header in response_headers:
+                variants[header] = response_headers[header]
+        for encoding in ENCODINGS:
+            variants[encoding] = base64.b64encode(compress(body, encoding)).decode()
+        async with redis.pipeline(transaction=True) as pipe:
+            try:
+                await pipe.watch(*generation_keys)
+                if await pipe.mget(generation_keys) != generations:
+                    return
+                pipe.multi()
+                pipe.hset(key, mapping=variants)
+                pipe.expire(key, self.ttl)
+                for tag in tags:
+                    pipe.sadd(response_tag_key(tag), key)
+                    pipe.expire(response_tag_key(tag), self.ttl)
+                await pipe.execute()
+            except WatchError:
+                return
@@ -1,9 +1,16 @@
 # issues: 2060 https://github.com/tiangolo/fastapi/issues/2060from
 
+import inspect
+from datetime import datetime
+from functools import wraps
 from typing import Any, Callable
 
+import orjson
 from fastapi import APIRouter as FastAPIRouter
+from fastapi.routing import APIRoute
 from fastapi.types import DecoratedCallable
+from pydantic import BaseModel
+from starlette.responses import Response
 
 
 class APIRouter(FastAPIRouter):
@@ -27,3 +34,64 @@ class APIRouter(FastAPIRouter):
             return add_path(func)
 
         return decorator
+
+
+def format_datetime(value: Any) -> str:
+    """
+    Format datetimes as "2021-11-22T10:00:00.000000Z" like the json encoders
+    of the schemas, the fraction is kept when microseconds are zero.
+    """
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+    raise TypeError
+
+
+class FastJSONResponse(Response):
+    """
+    JSON response rendered by orjson, datetimes are formatted
+    in the same pass as "2021-11-22T10:00:00.000000Z".
+    """
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, BaseModel):
+            content = content.dict()
+        return orjson.dumps(
+            content, default=format_datetime, option=orjson.OPT_PASSTHROUGH_DATETIME
+        )
+
+
+class FastJSONRoute(APIRoute):
+    """
+    Route that renders a returned Pydantic model with FastJSONResponse.
+    The model is built by the handler, so the second validation
+    against response_model and jsonable_encoder are skipped.
+    Headers, status code and background tasks set on the injected
+    Response parameter are kept.
+    """
+
+    def __init__(self, path: str, endpoint: Callable[..., Any], **kwargs: Any):
+        response_params = [
+            name
+            for name, param in inspect.signature(endpoint).parameters.items()
+            if inspect.isclass(param.annotation)
+            and issubclass(param.annotation, Response)
+        ]
+
+        @wraps(endpoint)
+        async def fast_endpoint(*args: Any, **values: Any) -> Any:
+            content = await endpoint(*args, **values)
+            if not isinstance(content, BaseModel):
+                return content
+            response = FastJSONResponse(content, status_code=self.status_code or 200)
+            for name in response_params:
+                sub_response = values[name]
+                response.headers.update(sub_response.headers)
+                if sub_response.status_code:
+                    response.status_code = sub_response.status_code
+                if sub_response.background:
+                    response.background = sub_response.background
+            return response
+
+        super().__init__(path, fast_endpoint, **kwargs)
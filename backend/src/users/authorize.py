@@ -1,3 +1,6 @@
+from datetime import datetime, timedelta
+from typing import NamedTuple
+
 import jwt
 from fastapi import Security
 from fastapi.exceptions import HTTPException
@@ -33,17 +36,39 @@ def clear_token(token):
     raise HTTPException(status_code=HTTP_401_UNAUTHORIZED)
 
 
-def encode_jwt(email, password):
+class TokenData(NamedTuple):
+    user_id: int
+    version: int
+
+
+def encode_jwt(user) -> str:
     """
-    Create token by email and password.
+    Create token with user id, token version and expiry claims.
+    """
+    payload = {
+        "sub": str(user.id),
+        "ver": user.token_version,
+        "exp": datetime.utcnow() + timedelta(minutes=config.TOKEN_EXPIRE_MINUTES),
+    }
+    return jwt.encode(payload, config.SECRET, algorithm=config.ALGORITHM)
+
+
+def decode_jwt(token: str) -> TokenData:
     """
-    token_jwt = jwt.encode({email: password}, config.SECRET, algorithm=config.ALGORITHM)
-    return token_jwt
+    Verify signature and expiry of the token and return its claims.
+
+    Otherwise causes an exception.
+    """
+    try:
+        payload = jwt.decode(token, config.SECRET, algorithms=[config.ALGORITHM])
+        return TokenData(int(payload["sub"]), int(payload["ver"]))
+    except (jwt.InvalidTokenError, KeyError, ValueError):
+        raise HTTPException(status_code=HTTP_401_UNAUTHORIZED)
 
 
-def check_token(raw_token: str = Security(api_key_header)):
+def check_token(raw_token: str = Security(api_key_header)) -> TokenData:
     """
     Checking the token received from "Authorization" header.
-    Returns a token.
+    Returns claims of the token.
     """
-    return clear_token(raw_token)
+    return decode_jwt(clear_token(raw_token))
@@ -0,0 +1,132 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from time import monotonic
+from typing import Dict, Optional, Tuple
+
+from aioredis import Redis
+from aioredis.exceptions import ConnectionError, TimeoutError
+
+from settings import config
+from src.db.models import User
+from src.users import authorize
+
+INVALIDATE_CHANNEL = "user_cache:invalidate"
+# Seconds to wait for a message, less than REDIS_SOCKET_TIMEOUT.
+POLL_TIMEOUT = 0.5
+
+logger = logging.getLogger(__name__)
+
+
+class UserSnapshot:
+    """
+    Light copy of the User model fields used by authenticated routes.
+    """
+
+    __slots__ = ("id", "email", "username", "bio", "image", "token_version")
+
+    def __init__(self, user: User):
+        self.id = user.id
+        self.email = user.email
+        self.username = user.username
+        self.bio = user.bio
+        self.image = user.image
+        self.token_version = user.token_version
+
+    @property
+    def token(self) -> str:
+        """
+        A new token of the current version.
+        """
+        return authorize.encode_jwt(self)
+
+    def __repr__(self):
+        return f"UserSnapshot(email={self.email},username={self.username})"
+
+
+class UserCache:
+    """
+    Bounded LRU cache of user snapshots by user id with a time to live.
+    """
+
+    def __init__(self, maxsize: int, ttl: int):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._users: "OrderedDict[int, Tuple[float, UserSnapshot]]" = OrderedDict()
+
+    def get(self, user_id: int) -> Optional[UserSnapshot]:
+        item = self._users.get(user_id)
+        if item is None or item[0] < monotonic():
+            self._users.pop(user_id, None)
+            self.misses += 1
+            return None
+        self._users.move_to_end(user_id)
+        self.hits += 1
+        return item[1]
+
+    def set(self, user: UserSnapshot):
+        self._users[user.id] = (monotonic() + self.ttl, user)
+        self._users.move_to_end(user.id)
+        while len(self._users) > self.maxsize:
+            self._users.popitem(last=False)
+
+    def invalidate(self, user_id: int):
+        self._users.pop(user_id, None)
+
+    def invalidate_all(self):
+        """
+        Drop the cached users, the statistics are kept.
+        """
+        self._users.clear()
+
+    def clear(self):
+        self._users.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._users),
+            "maxSize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+user_cache = UserCache(config.USER_CACHE_SIZE, config.USER_CACHE_TTL)
+
+
+async def invalidate_user(redis: Redis, user_id: int):
+    """
+    Remove the user snapshot from the cache of this and other workers.
+    """
+    user_cache.invalidate(user_id)
+    await redis.publish(INVALIDATE_CHANNEL, user_id)
+
+
+async def listen_invalidations(redis: Redis):
+    """
+    Remove user snapshots invalidated by other workers.
+    Messages are polled for shorter than the socket timeout, so an idle
+    channel does not fail. On any error the subscription is restarted
+    and the cached users are dropped, invalidations may have been missed.
+    """
+    while True:
+        try:
+            async with redis.pubsub() as pubsub:
+                await pubsub.subscribe(INVALIDATE_CHANNEL)
+                user_cache.invalidate_all()
+                while True:
+                    message = await pubsub.get_message(
+                        ignore_subscribe_messages=True, timeout=POLL_TIMEOUT
+                    )
+                    if message and message["type"] == "message":
+                        user_cache.invalidate(int(message["data"]))
+        except (ConnectionError, TimeoutError):
+            logger.warning("User cache invalidations are restarted", exc_info=True)
+        except Exception:
+            logger.exception("User cache invalidations failed")
+        user_cache.invalidate_all()
+        await asyncio.sleep(1)
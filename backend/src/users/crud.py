@@ -1,32 +1,78 @@
+from typing import Iterable, Optional, Set
+
+from aioredis import Redis
 from fastapi import HTTPException
 from fastapi.params import Depends
-from sqlalchemy import delete, update
+from sqlalchemy import String, case, cast, delete, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.engine import Row
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
+from sqlalchemy.sql.dml import Update
+from sqlalchemy.sql.selectable import CTE, Select
 from starlette.status import HTTP_401_UNAUTHORIZED
 
+from src.articles.feed import backfill_feed, trim_feed
+from src.conditional import bump_versions
 from src.db.database import get_db
 from src.db.models import Follow, User
+from src.response_cache import invalidate_responses
 from src.users import authorize, schemas
+from src.users.cache import UserSnapshot, invalidate_user, user_cache
+from src.users.passwords import is_hashed, password_hasher
 
 
 async def get_curr_user_by_token(
-    db: AsyncSession = Depends(get_db), token: str = Depends(authorize.check_token)
-) -> User:
+    db: AsyncSession = Depends(get_db),
+    token: authorize.TokenData = Depends(authorize.check_token),
+) -> UserSnapshot:
     """
-    Getting a User model from a token and checking that the user exists.
+    Getting a User snapshot from token claims and checking that the user exists.
     """
-    user = await get_user_by_token(db, token)
+    user = await get_user_by_claims(db, token)
     if not user:
         raise HTTPException(status_code=HTTP_401_UNAUTHORIZED, detail="Not authorized")
     return user
 
 
-async def get_user_by_token(db: AsyncSession, token: int) -> User:
+async def get_user_by_claims(
+    db: AsyncSession, token: authorize.TokenData
+) -> Optional[UserSnapshot]:
+    """
+    Get a snapshot of User model by verified token claims.
+    The snapshot is cached in the worker memory, the row is loaded
+    only on a cache miss or when the token is newer than the snapshot.
+    Returns None if the token version was revoked.
+    """
+    user = user_cache.get(token.user_id)
+    if user is None or user.token_version < token.version:
+        db_user = await get_user_by_id(db, token.user_id)
+        if not db_user:
+            return None
+        user = UserSnapshot(db_user)
+        user_cache.set(user)
+    if user.token_version != token.version:
+        return None
+    return user
+
+
+async def get_user_by_token(db: AsyncSession, token: str) -> Optional[UserSnapshot]:
+    """
+    Get a snapshot of User model by token.
+    Returns None if the token is invalid.
+    """
+    try:
+        claims = authorize.decode_jwt(token)
+    except HTTPException:
+        return None
+    return await get_user_by_claims(db, claims)
+
+
+async def get_user_by_id(db: AsyncSession, user_id: int) -> User:
     """
-    Get User model by token.
+    Get User model by id.
     """
-    user = await db.execute(select(User).filter(User.token == token))
+    user = await db.execute(select(User).filter(User.id == user_id))
     return user.scalars().first()
 
 
@@ -46,59 +92,194 @@ async def get_user_by_email(db: AsyncSession, email: str) -> User:
     return user.scalars().first()
 
 
-async def create_user(db: AsyncSession, user: schemas.NewUserRequest) -> User:
+async def create_user(
+    db: AsyncSession, user: schemas.NewUserRequest
+) -> Optional[UserSnapshot]:
     """
-    Create and return a created User model.
+    Create User model and return its snapshot.
+    Returns None if the email or the username is already registered.
     """
-    db_user = User(
-        token=authorize.encode_jwt(user.user.email, user.user.password),
-        username=user.user.username,
-        email=user.user.email,
-        password=user.user.password,
-        bio="default",
-        image="default",
+    stmt = await db.execute(
+        insert(User)
+        .values(
+            username=user.user.username,
+            email=user.user.email,
+            password=await password_hasher.hash(user.user.password),
+            bio="default",
+            image="default",
+        )
+        .on_conflict_do_nothing()
+        .returning(
+            User.id,
+            User.email,
+            User.username,
+            User.bio,
+            User.image,
+            User.token_version,
+        )
     )
-    db.add(db_user)
+    db_user = stmt.first()
     await db.commit()
-    return db_user
+    return UserSnapshot(db_user) if db_user else None
+
+
+async def authenticate_user(
+    db: AsyncSession, email: str, password: str
+) -> Optional[UserSnapshot]:
+    """
+    Get a snapshot of User model by email and password.
+    A password stored in plain text is replaced with its hash.
+    """
+    db_user = await get_user_by_email(db, email)
+    if not db_user or not await password_hasher.verify(password, db_user.password):
+        return None
+    user = UserSnapshot(db_user)
+    if not is_hashed(db_user.password):
+        up_user = (
+            update(User)
+            .where(User.id == db_user.id)
+            .values(password=await password_hasher.hash(password))
+        )
+        await db.execute(up_user)
+        await db.commit()
+    return user
 
 
 async def change_user(
-    db: AsyncSession, user: schemas.UserResponse, data: schemas.UserResponse
-) -> User:
+    db: AsyncSession,
+    redis: Redis,
+    user: UserSnapshot,
+    data: schemas.UpdateUserRequest,
+) -> UserSnapshot:
     """
-    Update and return User model.
+    Update User model and return its new snapshot.
+    A password change increments the token version and revokes issued tokens.
+    The cached snapshot of the user is invalidated in all workers,
+    the profile version replaces cached articles of the user
+    and responses with authors are removed.
     """
+    values = data.user.dict(exclude_unset=True, exclude={"token"})
+    if "password" in values:
+        values["password"] = await password_hasher.hash(values["password"])
+        values["token_version"] = User.token_version + 1
     up_user = (
         update(User)
-        .where(User.token == user.token)
-        .values(**data.user.dict(exclude_unset=True))
+        .where(User.id == user.id)
+        .values(**values)
+        .execution_options(synchronize_session="fetch")
     )
     await db.execute(up_user)
     await db.commit()
-    return user
+    await invalidate_user(redis, user.id)
+    await invalidate_responses(redis, "authors")
+    usernames = {user.username, values.get("username", user.username)}
+    await bump_versions(redis, *[f"profile:{username}" for username in usernames])
+    stmt = await db.execute(
+        select(User)
+        .filter(User.id == user.id)
+        .execution_options(populate_existing=True)
+    )
+    return UserSnapshot(stmt.scalars().first())
 
 
-async def create_subscribe(db: AsyncSession, user_username: str, author_username: str):
+def update_follow_counts(changed: CTE, step: int) -> Update:
     """
-    Create Follow model by user and author username.
-    The function does not return anything.
+    Query changing "followers_count" and "following_count" of the users
+    of the inserted or deleted Follow rows by step.
     """
-    db_subscribe = Follow(user=user_username, author=author_username)
-    db.add(db_subscribe)
+    return (
+        update(User)
+        .where(User.username.in_([changed.c.user, changed.c.author]))
+        .values(
+            followers_count=User.followers_count
+            + case((User.username == changed.c.author, step), else_=0),
+            following_count=User.following_count
+            + case((User.username == changed.c.user, step), else_=0),
+        )
+        .returning(User.id)
+    )
+
+
+def select_follow_change(author: CTE, changed: CTE, step: int) -> Select:
+    """
+    Query of the author profile and the "changed" flag of a follow change.
+    The Follow rows of the changed query update the counters of the users.
+    Returns no rows if the author is not found.
+    """
+    counted = update_follow_counts(changed, step).cte("counted")
+    return select(
+        author.c.username,
+        author.c.bio,
+        author.c.image,
+        select(counted.c.id).exists().label("changed"),
+    )
+
+
+async def create_subscribe(
+    db: AsyncSession, user_username: str, author_username: str
+) -> Optional[Row]:
+    """
+    Create Follow model by user and author username with one statement,
+    update the counters and add the latest articles of the author to the user feed.
+    Returns the author profile with the "changed" flag,
+    which is False if the user is already subscribed, or None if the author
+    is not found.
+    """
+    author = (
+        select(User.username, User.bio, User.image)
+        .where(User.username == author_username)
+        .cte("author")
+    )
+    inserted = (
+        insert(Follow)
+        .from_select(
+            ["user", "author"],
+            select(cast(user_username, String), author.c.username),
+        )
+        .on_conflict_do_nothing()
+        .returning(Follow.user, Follow.author)
+        .cte("inserted")
+    )
+    stmt = await db.execute(select_follow_change(author, inserted, 1))
+    row = stmt.first()
+    if row is None or not row.changed:
+        return row
+    await backfill_feed(db, user_username, author_username)
     await db.commit()
+    return row
 
 
-async def delete_subscribe(db: AsyncSession, user_username: str, author_username: str):
+async def delete_subscribe(
+    db: AsyncSession, user_username: str, author_username: str
+) -> Optional[Row]:
     """
-    Delete Follow model by user and author username.
-    The function does not return anything.
+    Delete Follow model by user and author username with one statement,
+    update the counters and remove articles of the author from the user feed.
+    Returns the author profile with the "changed" flag,
+    which is False if the user is not subscribed, or None if the author
+    is not found.
     """
-    subscribe = delete(Follow).where(
-        Follow.user == user_username, Follow.author == author_username
+    author = (
+        select(User.username, User.bio, User.image)
+        .where(User.username == author_username)
+        .cte("author")
+    )
+    deleted = (
+        delete(Follow)
+        .where(
+            Follow.user == user_username,
+            Follow.author.in_(select(author.c.username)),
+        )
+        .returning(Follow.user, Follow.author)
+        .cte("deleted")
     )
-    await db.execute(subscribe)
+    stmt = await db.execute(select_follow_change(author, deleted, -1))
+    row = stmt.first()
+    if row is None or not row.changed:
+        return row
+    await trim_feed(db, user_username, author_username)
     await db.commit()
+    return row
 
 
 async def check_subscribe(db: AsyncSession, follower: str, following: str) -> bool:
@@ -111,3 +292,22 @@ async def check_subscribe(db: AsyncSession, follower: str, following: str) -> bo
     )
     check = check.scalars().first()
     return True if check else False
+
+
+async def select_subscribed_authors(
+    db: AsyncSession, follower: str, authors: Iterable[str]
+) -> Set[str]:
+    """
+    Get usernames of the authors the follower is subscribed to.
+    Distinct authors are checked with one query.
+    """
+    authors = set(authors)
+    if not authors:
+        return set()
+    query = select(Follow.author).where(Follow.user == follower)
+    if len(authors) == 1:
+        query = query.where(Follow.author == authors.pop())
+    else:
+        query = query.where(Follow.author.in_(authors))
+    stmt = await db.execute(query)
+    return set(stmt.scalars().all())
@@ -0,0 +1,107 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from fastapi import HTTPException
+from starlette.status import HTTP_503_SERVICE_UNAVAILABLE
+
+from settings import config
+
+SCHEME = "scrypt"
+
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    return hashlib.scrypt(
+        password.encode(), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r, dklen=32
+    )
+
+
+def _hash(password: str) -> str:
+    """
+    Hash the password with a random salt.
+    Result form: scrypt$n$r$p$salt$hash.
+    """
+    n, r, p = config.SCRYPT_N, config.SCRYPT_R, config.SCRYPT_P
+    salt = os.urandom(16)
+    digest = _scrypt(password, salt, n, r, p)
+    return "$".join(
+        [
+            SCHEME,
+            str(n),
+            str(r),
+            str(p),
+            base64.b64encode(salt).decode(),
+            base64.b64encode(digest).decode(),
+        ]
+    )
+
+
+def _verify(password: str, hashed: str) -> bool:
+    """
+    Check the password against the hash.
+    Passwords stored before hashing was introduced are compared as is.
+    """
+    if not is_hashed(hashed):
+        return hmac.compare_digest(password.encode(), hashed.encode())
+    _, n, r, p, salt, digest = hashed.split("$")
+    expected = _scrypt(password, base64.b64decode(salt), int(n), int(r), int(p))
+    return hmac.compare_digest(expected, base64.b64decode(digest))
+
+
+def is_hashed(hashed: Optional[str]) -> bool:
+    return bool(hashed) and hashed.startswith(SCHEME + "$")
+
+
+class PasswordHasher:
+    """
+    Runs hashing in a thread pool of limited size, scrypt releases the GIL.
+    The number of waiting jobs is limited, if there is no free place
+    for the timeout, an exception is raised instead of stalling the worker.
+    """
+
+    def __init__(self, max_workers: int, max_pending: int, timeout: float):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._executor = None
+        self._semaphore = None
+
+    def start(self):
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="password"
+        )
+        self._semaphore = asyncio.Semaphore(self.max_workers + self.max_pending)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+        self._executor = None
+
+    async def _run(self, func, *args):
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            raise HTTPException(
+                status_code=HTTP_503_SERVICE_UNAVAILABLE, detail="Server is busy"
+            )
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, func, *args)
+        finally:
+            self._semaphore.release()
+
+    async def hash(self, password: str) -> str:
+        return await self._run(_hash, password)
+
+    async def verify(self, password: str, hashed: str) -> bool:
+        return await self._run(_verify, password, hashed)
+
+
+password_hasher = PasswordHasher(
+    config.PASSWORD_HASH_WORKERS,
+    config.PASSWORD_HASH_PENDING,
+    config.PASSWORD_HASH_TIMEOUT,
+)
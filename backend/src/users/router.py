@@ -1,10 +1,25 @@
-from fastapi import HTTPException, Request
+from aioredis import Redis
+from fastapi import HTTPException, Request, Response
 from fastapi.params import Depends
 from sqlalchemy.ext.asyncio import AsyncSession
 from starlette.status import HTTP_401_UNAUTHORIZED
 
+from src.conditional import (
+    bump_versions,
+    get_versions,
+    is_not_modified,
+    make_etag,
+    not_modified,
+    viewer_names,
+)
 from src.db import models
-from src.db.database import get_db
+from src.db.database import (
+    get_db,
+    get_db_read,
+    get_request_user_id,
+    stick_to_primary,
+)
+from src.db.redis import get_redis
 from src.router_setting import APIRouter
 from src.users import utils
 
@@ -24,8 +39,9 @@ async def authentication(
     """
     Login for existing user.
     """
-    token = authorize.encode_jwt(user_login.user.email, user_login.user.password)
-    user = await crud.get_user_by_token(db, token)
+    user = await crud.authenticate_user(
+        db, user_login.user.email, user_login.user.password
+    )
     if user:
         return schemas.UserResponse(user=user)
     raise HTTPException(status_code=HTTP_401_UNAUTHORIZED, detail="Not authorized")
@@ -38,18 +54,19 @@ async def authentication(
     tags=["User and Authentication"],
 )
 async def register_user(
-    new_user: schemas.NewUserRequest, db: AsyncSession = Depends(get_db)
+    request: Request,
+    new_user: schemas.NewUserRequest,
+    db: AsyncSession = Depends(get_db),
 ):
     """
     Register a new user.
     """
-    db_user_email = await crud.get_user_by_email(db, new_user.user.email)
-    if db_user_email:
-        raise HTTPException(status_code=400, detail="Email already registered")
-    db_user_username = await crud.get_user_by_username(db, new_user.user.username)
-    if db_user_username:
-        raise HTTPException(status_code=400, detail="Username already registered")
     user = await crud.create_user(db, new_user)
+    if not user:
+        if await crud.get_user_by_email(db, new_user.user.email):
+            raise HTTPException(status_code=400, detail="Email already registered")
+        raise HTTPException(status_code=400, detail="Username already registered")
+    await stick_to_primary(request, user.id)
     return schemas.UserResponse(user=user)
 
 
@@ -71,13 +88,14 @@ async def current_user(user: models.User = Depends(crud.get_curr_user_by_token))
 async def update_user(
     data: schemas.UpdateUserRequest,
     db: AsyncSession = Depends(get_db),
+    redis: Redis = Depends(get_redis),
     user: models.User = Depends(crud.get_curr_user_by_token),
 ):
     """
     Updated user information for current user.
     """
     if user:
-        new_user = await crud.change_user(db, user, data)
+        new_user = await crud.change_user(db, redis, user, data)
         return schemas.UpdateUserRequest(user=new_user)
     raise HTTPException(status_code=HTTP_401_UNAUTHORIZED, detail="Not authorized")
 
@@ -86,21 +104,45 @@ async def update_user(
     "/profiles/{username}", response_model=schemas.ProfileUserResponse, tags=["Profile"]
 )
 async def get_profile(
-    request: Request, username: str, db: AsyncSession = Depends(get_db)
+    request: Request,
+    response: Response,
+    username: str,
+    db: AsyncSession = Depends(get_db_read),
+    redis: Redis = Depends(get_redis),
 ):
     """
     Get a profile of a user of the system.
+    Returns 304 without a database query if "If-None-Match" matches the ETag.
+    Versions are created only for found users, the response without them
+    has no ETag.
     Auth is optional.
     """
+    user_id = get_request_user_id(request)
+    names = [f"profile:{username}", *viewer_names(user_id)]
+    etag = await make_etag(redis, [username, user_id], *names, create=False)
+    if (
+        etag
+        and is_not_modified(request, etag)
+        and (user_id is not None or "authorization" not in request.headers)
+    ):
+        return not_modified(etag)
     profile_user = await crud.get_user_by_username(db, username)
     if not profile_user:
         raise HTTPException(status_code=400, detail="User not found")
     authorization = request.headers.get("authorization")
     if authorization:
         token = authorize.clear_token(authorization)
-        current_user = await crud.get_curr_user_by_token(db, token)
+        current_user = await crud.get_user_by_token(db, token)
+        if not current_user:
+            raise HTTPException(
+                status_code=HTTP_401_UNAUTHORIZED, detail="Not authorized"
+            )
         if current_user.username != profile_user.username:
             profile_user = await utils.add_following(db, profile_user, current_user)
+    if etag:
+        response.headers["ETag"] = etag
+    else:
+        await get_versions(redis, *names)
     return schemas.ProfileUserResponse(profile=profile_user)
 
 
@@ -112,24 +154,31 @@ async def get_profile(
 async def create_follow(
     username: str,
     db: AsyncSession = Depends(get_db),
+    redis: Redis = Depends(get_redis),
     follower: models.User = Depends(crud.get_curr_user_by_token),
 ):
     """
     Follow a user by username.
+    The author is looked up by the statement creating the subscription.
     """
-    following = await crud.get_user_by_username(db, username)
-    if not following:
-        raise HTTPException(status_code=400, detail="User not found")
-    if follower == following:
+    if follower.username == username:
         raise HTTPException(status_code=400, detail="You cannot subscribe to yourself")
-    subscribe = await crud.check_subscribe(db, follower.username, following.username)
-    if subscribe:
+    following = await crud.create_subscribe(
+        db, user_username=follower.username, author_username=username
+    )
+    if following is None:
+        raise HTTPException(status_code=400, detail="User not found")
+    if not following.changed:
         raise HTTPException(status_code=400, detail="You are already a subscribed user")
-    await crud.create_subscribe(
-        db, user_username=follower.username, author_username=following.username
+    await bump_versions(redis, f"follows:{follower.id}")
+    return schemas.ProfileUserResponse(
+        profile=schemas.ProfileUser(
+            username=following.username,
+            bio=following.bio,
+            image=following.image,
+            following=True,
+        )
     )
-    following.following = True
-    return schemas.ProfileUserResponse(profile=following)
 
 
 @router_user.delete(
@@ -140,20 +189,28 @@ async def create_follow(
 async def delete_follow(
     username: str,
     db: AsyncSession = Depends(get_db),
+    redis: Redis = Depends(get_redis),
     follower: models.User = Depends(crud.get_curr_user_by_token),
 ):
     """
     Unfollow a user by username.
+    The author is looked up by the statement deleting the subscription.
     """
-    following = await crud.get_user_by_username(db, username)
-    if not following:
+    following = await crud.delete_subscribe(
+        db, user_username=follower.username, author_username=username
+    )
+    if following is None:
         raise HTTPException(status_code=400, detail="User not found")
-    subscribe = await crud.check_subscribe(db, follower.username, following.username)
-    if not subscribe:
+    if not following.changed:
         raise HTTPException(
             status_code=400, detail="You are not a subscribed this user"
         )
-    await crud.delete_subscribe(
-        db, user_username=follower.username, author_username=following.username
+    await bump_versions(redis, f"follows:{follower.id}")
+    return schemas.ProfileUserResponse(
+        profile=schemas.ProfileUser(
+            username=following.username,
+            bio=following.bio,
+            image=following.image,
+            following=False,
+        )
     )
-    return schemas.ProfileUserResponse(profile=following)
@@ -48,6 +48,7 @@ class UserResponse(BaseModel):
 class UpdateUser(BaseModel):
     email: Optional[str] = None
     token: Optional[str] = None
+    password: Optional[str] = None
     username: Optional[str] = None
     bio: Optional[str] = None
     image: Optional[str] = None
@@ -1,3 +1,5 @@
+from typing import List
+
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.db.models import User
@@ -13,3 +15,18 @@ async def add_following(db: AsyncSession, user: User, follower: User) -> User:
     if subscribe:
         user.following = True
     return user
+
+
+async def add_following_authors(
+    db: AsyncSession, users: List[User], follower: User
+) -> List[User]:
+    """
+    Add a subscriber to the pydantic User models of the authors,
+    all Follow models are checked with one query.
+    """
+    subscribed = await crud.select_subscribed_authors(
+        db, follower.username, (user.username for user in users)
+    )
+    for user in users:
+        user.following = user.username in subscribed
+    return users
@@ -4,12 +4,16 @@ from functools import wraps
 from typing import AsyncGenerator, Callable, Dict, Generator, List, Tuple
 
 import pytest
+from aioredis import Redis
+from asgi_lifespan import LifespanManager
 from fastapi import FastAPI
 from httpx import AsyncClient
 from settings import config
 from sqlalchemy.ext.asyncio import AsyncSession
+from src.articles.tags import tag_cache
 from src.db.database import create_engine_async_app
 from src.db.models import Tag
+from src.users.cache import user_cache
 from starlette.responses import Response
 
 
@@ -24,16 +28,7 @@ def event_loop() -> Generator:
 
 
 @pytest.fixture(scope="function")
-async def flush_redis():
-    """
-    Remove Redis database.
-    """
-    yield
-    await config.redis_db.flushdb()
-
-
-@pytest.fixture(scope="function")
-async def db(flush_redis) -> AsyncSession:
+async def db() -> AsyncSession:
     engine, async_session = create_engine_async_app(config.sqlalchemy_db)
     async with engine.begin() as connection:
         async with async_session(bind=connection) as session:
@@ -54,18 +49,32 @@ def override_get_db(db: AsyncSession) -> Callable:
 @pytest.fixture(scope="function")
 def app(override_get_db: Callable) -> FastAPI:
 
-    from src.db.database import get_db
+    from src.db.database import get_db, get_db_read
 
     from ..main import app
 
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_db_read] = override_get_db
     return app
 
 
 @pytest.fixture(scope="function")
 async def client(app: FastAPI) -> AsyncGenerator:
-    async with AsyncClient(app=app, base_url="http://test") as ac:
-        yield ac
+    """
+    Client of the running application.
+    Redis database, the user and tag caches are removed after the test.
+    """
+    user_cache.clear()
+    tag_cache.clear()
+    async with LifespanManager(app):
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            yield ac
+        await app.state.redis.flushdb()
+
+
+@pytest.fixture(scope="function")
+def redis(client: AsyncGenerator, app: FastAPI) -> Redis:
+    return app.state.redis
 
 
 @pytest.fixture
@@ -1,11 +1,18 @@
+import json
+from operator import itemgetter
 from typing import AsyncGenerator, Dict, List, Tuple
 
 import pytest
+from aioredis import Redis
 from settings import config
 from slugify import slugify
 from sqlalchemy import func
 from sqlalchemy.ext.asyncio.session import AsyncSession
+from sqlalchemy.future import select
+from src.articles import crud
+from src.articles.utils import get_article_key
 from src.db.models import Article, Tag
+from src.response_cache import choose_encoding, invalidate_responses
 from starlette.responses import Response
 from starlette.testclient import TestClient
 
@@ -32,6 +39,47 @@ async def test_get_tags(
         response.json()["tags"] == create_and_get_tags
     ), "A list of name tags is expected."
 
+    response_not_modified = await client.get(
+        "/tags", headers={"If-None-Match": response.headers["etag"]}
+    )
+    assert response_not_modified.status_code == 304, "Expected 304 code."
+
+
+async def test_search_articles(
+    client: AsyncGenerator,
+    data_first_article: Dict[str, Dict[str, str]],
+    data_second_article: Dict[str, Dict[str, str]],
+    create_and_get_response_two_article: Tuple[Response],
+) -> None:
+    """
+    Test full-text search of articles with the cursor.
+    Auth is optional.
+    """
+    first_slug = slugify(data_first_article["article"]["title"])
+    second_slug = slugify(data_second_article["article"]["title"])
+
+    response = await client.get("/articles/search", params={"q": "first"})
+    assert response.status_code == 200, "Expected 200 code."
+    assert [article["slug"] for article in response.json()["articles"]] == [
+        first_slug
+    ], "Only the matching article is expected."
+
+    response_first_page = await client.get(
+        "/articles/search", params={"q": "title", "limit": 1}
+    )
+    content = response_first_page.json()
+    assert [article["slug"] for article in content["articles"]] == [
+        second_slug
+    ], "Articles with the same rank are expected from the newest."
+
+    response_second_page = await client.get(
+        "/articles/search",
+        params={"q": "title", "limit": 1, "cursor": content["nextCursor"]},
+    )
+    assert [article["slug"] for article in response_second_page.json()["articles"]] == [
+        first_slug
+    ], "The cursor does not lead to the next page."
+
 
 async def test_set_up_article(
     db: AsyncSession,
@@ -90,6 +138,47 @@ async def test_set_up_article(
     assert count_articles == 2, "The article was not saved in the database."
 
 
+async def test_import_articles(
+    db: AsyncSession,
+    client: AsyncGenerator,
+    token_first_user: str,
+    data_first_article: Dict[str, Dict[str, str]],
+    data_second_article: Dict[str, Dict[str, str]],
+) -> None:
+    """
+    Test import articles from NDJSON.
+    Auth is required.
+    """
+    data_second_article["article"]["tagList"] = ["import", "bulk"]
+    long_tag = {"article": {**data_first_article["article"], "tagList": ["t" * 51]}}
+    lines = [data_first_article, data_second_article, data_first_article, {}, long_tag]
+    body = "\n".join(json.dumps(line) for line in lines)
+
+    response_without_auth = await client.post("/articles/import", content=body)
+    assert response_without_auth.status_code == 401, "Expected 401 code."
+
+    response = await client.post(
+        "/articles/import",
+        headers={"Authorization": f"Token {token_first_user}"},
+        content=body,
+    )
+    assert response.status_code == 200, "Expected 200 code."
+    results = [json.loads(line) for line in response.text.splitlines()]
+    statuses = [result["status"] for result in sorted(results, key=itemgetter("line"))]
+    assert statuses == [
+        "created",
+        "created",
+        "exists",
+        "invalid",
+        "invalid",
+    ], "Every line is expected to get its result."
+
+    stmt = await db.execute(func.count(Article.id))
+    assert stmt.scalar() == 2, "The imported articles were not saved in the database."
+    stmt = await db.execute(select(Tag.name).order_by(Tag.name))
+    assert stmt.scalars().all() == ["bulk", "import"], "Missing tags were not created."
+
+
 async def test_get_articles(
     db: AsyncSession,
     client: AsyncGenerator,
@@ -120,7 +209,7 @@ async def test_get_articles(
     )
     content = response_all_article.json()
     assert response_all_article.status_code == 200, "Expected 200 code."
-    check_content_article(content["articles"][0], data_first_article, data_first_user)
+    check_content_article(content["articles"][1], data_first_article, data_first_user)
     assert (
         content["articlesCount"] == count_articles
     ), "Not all articles from the database are displayed."
@@ -128,6 +217,14 @@ async def test_get_articles(
         content["articles"]
     ), " The number of articles does not match the articlesCount field."
 
+    response_summary = await client.get("/articles?view=summary")
+    assert response_summary.status_code == 200, "Expected 200 code."
+    content = response_summary.json()
+    assert content["articlesCount"] == count_articles
+    assert all(
+        "body" not in article and article["title"] for article in content["articles"]
+    ), "The summary contains the body of articles."
+
     response_by_tag = await client.get(
         f"/articles/?tag={second_tag}",
     )
@@ -173,6 +270,9 @@ async def test_get_articles(
     assert (
         content["articles"][0]["favorited"] is True
     ), "The status of the favorite article is not displayed in the favorited field."
+    assert (
+        content["articles"][0]["favoritesCount"] == 1
+    ), "The favorites count is not displayed in the list of articles."
     assert (
         content["articles"][0]["author"]["username"] == favorite_user
     ), "Filtering by favorite username articles does not work."
@@ -183,20 +283,37 @@ async def test_get_articles(
     response_by_limit = await client.get("/articles/?limit=1")
     assert (
         response_by_limit.json()["articles"][0]["title"]
-        == data_first_article["article"]["title"]
+        == data_second_article["article"]["title"]
     ), "Filtering by limit does not work."
 
     response_by_offset = await client.get("/articles/?offset=1")
     assert (
         response_by_offset.json()["articles"][0]["title"]
-        == data_second_article["article"]["title"]
+        == data_first_article["article"]["title"]
     ), "Filtering by offset does not work."
 
+    next_cursor = response_by_limit.json()["nextCursor"]
+    assert next_cursor, "The cursor of the next page is not displayed."
+    response_by_cursor = await client.get(f"/articles/?limit=1&cursor={next_cursor}")
+    assert (
+        response_by_cursor.json()["articles"][0]["title"]
+        == data_first_article["article"]["title"]
+    ), "Pagination by cursor does not work."
+
+    response_last_page = await client.get(f"/articles/?limit=2&cursor={next_cursor}")
+    assert (
+        response_last_page.json()["nextCursor"] is None
+    ), "The cursor is displayed on the last page."
+
+    response_fake_cursor = await client.get("/articles/?cursor=fakecursor")
+    assert response_fake_cursor.status_code == 400, "Expected 400 code."
+
 
 async def test_get_recent_articles_from_users_you_follow(
     client: TestClient,
     data_second_user: Dict[str, Dict[str, str]],
     token_first_user: str,
+    token_second_user: str,
     create_and_get_response_two_article: Tuple[Response],
     data_second_article: Dict[str, Dict[str, str]],
     create_follow: None,
@@ -220,6 +337,73 @@ async def test_get_recent_articles_from_users_you_follow(
         content["author"]["following"] is True
     ), "Subscriber status is not displayed in article."
 
+    data_second_article["article"]["title"] = "third_title"
+    await client.post(
+        "/articles",
+        headers={"Authorization": f"Token {token_second_user}"},
+        json=data_second_article,
+    )
+    response_feed = await client.get(
+        "/articles/feed", headers={"Authorization": f"Token {token_first_user}"}
+    )
+    content = response_feed.json()
+    assert content["articlesCount"] == 2, "The new article is not added to the feed."
+    assert (
+        content["articles"][0]["title"] == "third_title"
+    ), "The feed is not sorted by the most recent articles."
+
+    await client.delete(
+        f"/profiles/{data_second_user['user']['username']}/follow",
+        headers={"Authorization": f"Token {token_first_user}"},
+    )
+    response_feed = await client.get(
+        "/articles/feed", headers={"Authorization": f"Token {token_first_user}"}
+    )
+    assert (
+        response_feed.json()["articlesCount"] == 0
+    ), "Articles of the unfollowed user are left in the feed."
+
+
+async def test_feed_below_backfill_horizon(
+    client: AsyncGenerator,
+    monkeypatch: pytest.MonkeyPatch,
+    data_second_user: Dict[str, Dict[str, str]],
+    token_first_user: str,
+    token_second_user: str,
+    create_and_get_response_two_article: Tuple[Response],
+    data_second_article: Dict[str, Dict[str, str]],
+) -> None:
+    """
+    Test articles of a followed author older than the feed backfill
+    are pulled into the feed.
+    """
+    for title in ("third_title", "fourth_title"):
+        data_second_article["article"]["title"] = title
+        await client.post(
+            "/articles",
+            headers={"Authorization": f"Token {token_second_user}"},
+            json=data_second_article,
+        )
+    monkeypatch.setattr(config, "FEED_BACKFILL_LIMIT", 1)
+    headers = {"Authorization": f"Token {token_first_user}"}
+    await client.post(
+        f"/profiles/{data_second_user['user']['username']}/follow", headers=headers
+    )
+
+    response_feed = await client.get("/articles/feed", headers=headers)
+    content = response_feed.json()
+    assert content["articlesCount"] == 3, "Articles below the backfill are lost."
+    assert [article["title"] for article in content["articles"]][:2] == [
+        "fourth_title",
+        "third_title",
+    ], "The feed is not sorted by the most recent articles."
+
+    response_page = await client.get("/articles/feed?limit=1&offset=2", headers=headers)
+    assert (
+        response_page.json()["articles"][0]["title"]
+        == create_and_get_response_two_article[1].json()["article"]["title"]
+    ), "The oldest article is not on the last page."
+
 
 async def test_get_article(
     db: AsyncSession,
@@ -245,6 +429,164 @@ async def test_get_article(
     ), "Expected 400 code for fakeslug."
 
 
+async def test_get_article_cached(
+    client: AsyncGenerator,
+    token_first_user: str,
+    data_first_article: Dict[str, Dict[str, str]],
+    create_and_get_response_one_article: Response,
+) -> None:
+    """
+    Test responses for anonymous requests are cached
+    and removed from the cache when the article changes.
+    """
+    slug_article = slugify(data_first_article["article"]["title"])
+    response = await client.get(f"/articles/{slug_article}")
+    assert response.headers["x-cache"] == "MISS"
+    response_cached = await client.get(f"/articles/{slug_article}")
+    assert response_cached.headers["x-cache"] == "HIT", "The response is not cached."
+    assert response_cached.json() == response.json()
+
+    response_auth = await client.get(
+        f"/articles/{slug_article}",
+        headers={"Authorization": f"Token {token_first_user}"},
+    )
+    assert "x-cache" not in response_auth.headers, "Authorized response is cached."
+
+    await client.post(
+        f"/articles/{slug_article}/favorite",
+        headers={"Authorization": f"Token {token_first_user}"},
+    )
+    response = await client.get(f"/articles/{slug_article}")
+    assert response.headers["x-cache"] == "MISS", "The cache is not invalidated."
+    assert response.json()["article"]["favoritesCount"] == 1
+
+
+async def test_get_article_cached_stale_response(
+    client: AsyncGenerator,
+    redis: Redis,
+    monkeypatch: pytest.MonkeyPatch,
+    data_first_article: Dict[str, Dict[str, str]],
+    create_and_get_response_one_article: Response,
+) -> None:
+    """
+    Test a response rendered before the invalidation of its tags is not cached.
+    """
+    slug_article = slugify(data_first_article["article"]["title"])
+    get_article = crud.get_single_article_auth_or_not_auth
+
+    async def get_article_and_write(db, redis, slug, current_user=None):
+        article = await get_article(db, redis, slug, current_user)
+        await invalidate_responses(redis, f"article:{slug}")
+        return article
+
+    monkeypatch.setattr(
+        crud, "get_single_article_auth_or_not_auth", get_article_and_write
+    )
+    response = await client.get(f"/articles/{slug_article}")
+    assert response.headers["x-cache"] == "MISS"
+    monkeypatch.undo()
+    response = await client.get(f"/articles/{slug_article}")
+    assert (
+        response.headers["x-cache"] == "MISS"
+    ), "The response rendered before the invalidation is cached."
+
+
+async def test_choose_encoding() -> None:
+    """
+    Test the encoding of cached responses is chosen by q-values.
+    """
+    assert choose_encoding("gzip, br") == "br"
+    assert choose_encoding("br;q=0.5, gzip") == "gzip"
+    assert choose_encoding("br;q=0, gzip;q=0") == "identity"
+    assert choose_encoding("*;q=0") == "identity"
+    assert choose_encoding("gzip;q=0, *") == "br"
+    assert choose_encoding("") == "identity"
+
+
+async def test_get_article_stale_fill(
+    client: AsyncGenerator,
+    redis: Redis,
+    data_first_user: Dict[str, Dict[str, str]],
+    token_first_user: str,
+    data_first_article: Dict[str, Dict[str, str]],
+    create_and_get_response_one_article: Response,
+) -> None:
+    """
+    Test an article read before a write and cached after it is not served.
+    """
+    slug_article = slugify(data_first_article["article"]["title"])
+    headers = {"Authorization": f"Token {token_first_user}"}
+    key = await get_article_key(
+        redis, slug_article, data_first_user["user"]["username"]
+    )
+    await client.get(f"/articles/{slug_article}", headers=headers)
+    stale_article = await redis.get(key)
+    assert stale_article is not None, "The article was not saved in redis cache."
+
+    await client.put(
+        f"/articles/{slug_article}",
+        headers=headers,
+        json={"article": {"body": "new_body"}},
+    )
+    await redis.set(key, stale_article)
+    response = await client.get(f"/articles/{slug_article}", headers=headers)
+    assert (
+        response.json()["article"]["body"] == "new_body"
+    ), "The article cached before the write is served."
+
+
+async def test_get_article_not_modified(
+    client: AsyncGenerator,
+    token_first_user: str,
+    token_second_user: str,
+    data_first_article: Dict[str, Dict[str, str]],
+    create_and_get_response_one_article: Response,
+) -> None:
+    """
+    Test conditional requests of an article by ETag.
+    The ETag changes with the profile of the author only.
+    """
+    slug_article = slugify(data_first_article["article"]["title"])
+    headers = {"Authorization": f"Token {token_first_user}"}
+    response = await client.get(f"/articles/{slug_article}", headers=headers)
+    etag = response.headers["etag"]
+
+    response_not_modified = await client.get(
+        f"/articles/{slug_article}", headers={**headers, "If-None-Match": etag}
+    )
+    assert response_not_modified.status_code == 304, "Expected 304 code."
+
+    await client.put(
+        "/user",
+        headers={"Authorization": f"Token {token_second_user}"},
+        json={"user": {"bio": "second_bio"}},
+    )
+    response_not_modified = await client.get(
+        f"/articles/{slug_article}", headers={**headers, "If-None-Match": etag}
+    )
+    assert (
+        response_not_modified.status_code == 304
+    ), "The ETag is changed by the profile of another user."
+
+    await client.put("/user", headers=headers, json={"user": {"bio": "first_bio"}})
+    response_modified = await client.get(
+        f"/articles/{slug_article}", headers={**headers, "If-None-Match": etag}
+    )
+    assert response_modified.status_code == 200, "The ETag is not changed."
+    assert response_modified.json()["article"]["author"]["bio"] == "first_bio"
+    etag = response_modified.headers["etag"]
+
+    await client.post(f"/articles/{slug_article}/favorite", headers=headers)
+    response_modified = await client.get(
+        f"/articles/{slug_article}", headers={**headers, "If-None-Match": etag}
+    )
+    assert response_modified.status_code == 200, "The ETag is not changed."
+    assert response_modified.json()["article"]["favorited"]
+
+    response_list = await client.get("/articles", headers=headers)
+    assert "last-modified" in response_list.headers
+
+
 async def test_change_article(
     db: AsyncSession,
     client: AsyncGenerator,
@@ -283,10 +625,24 @@ async def test_change_article(
     )
     assert response_update_article_another_user.status_code == 400, "Expected 400 code."
 
+    response_update_tags = await client.put(
+        f"/articles/{slug_article}",
+        headers={"Authorization": f"Token {token_first_user}"},
+        json={"article": {"tagList": ["new_tag"]}},
+    )
+    assert response_update_tags.status_code == 200, "Expected 200 code."
+    assert response_update_tags.json()["article"]["tagList"] == [
+        "new_tag"
+    ], "The tags of the article are not replaced."
+    stmt = await db.execute(select(func.count(Tag.id)).where(Tag.name == "new_tag"))
+    assert stmt.scalar() == 1, "A missing tag is not created."
+
 
 async def test_remove_article(
     db: AsyncSession,
     client: AsyncGenerator,
+    redis: Redis,
+    data_first_user: Dict[str, Dict[str, str]],
     token_first_user: str,
     token_second_user: str,
     data_first_article: Dict[str, Dict[str, str]],
@@ -308,11 +664,15 @@ async def test_remove_article(
     count_articles = stmt.scalar()
 
     assert count_articles == 1, "The article was not add in the database."
-    count_favorites_from_redis = await config.redis_db.hget(
-        "count_favorites", slugify(data_first_article["article"]["title"])
+    cached_article = await redis.get(
+        await get_article_key(
+            redis,
+            slugify(data_first_article["article"]["title"]),
+            data_first_user["user"]["username"],
+        )
     )
-    assert count_articles == int(
-        count_favorites_from_redis
+    assert (
+        count_articles == json.loads(cached_article)["favorites_count"]
     ), "The article was not add in redis cache."
 
     slug_article = slugify(data_first_article["article"]["title"])
@@ -348,12 +708,11 @@ async def test_remove_article(
     assert count_articles == 0, "The article is not removed from the database."
 
     assert count_articles == 0, "The article was not removed in the database."
-    count_favorites_from_redis = await config.redis_db.hget(
-        "count_favorites", slugify(data_first_article["article"]["title"])
-    )
-    count_favorites_from_redis = (
-        0 if not count_favorites_from_redis else int(count_favorites_from_redis)
+    cached_article = await redis.get(
+        await get_article_key(
+            redis,
+            slugify(data_first_article["article"]["title"]),
+            data_first_user["user"]["username"],
+        )
     )
-    assert (
-        count_articles == count_favorites_from_redis
-    ), "The article was not add in redis cache."
+    assert cached_article is None, "The article was not removed in redis cache."
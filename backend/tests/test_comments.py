@@ -106,11 +106,27 @@ async def test_select_comment(
         len(content["comments"]) == 2
     ), "Not all comments on an article are displayed."
     assert count_comment == 2, "Comments are not saved in the database."
+    assert (
+        content["commentsCount"] == count_comment
+    ), "The number of comments does not match the commentsCount field."
     check_content_comment(content["comments"][1], data_comment, data_second_user)
     assert (
         content["comments"][1]["author"]["following"] is True
     ), "Subscription status is not displayed in the 'following' field"
 
+    response_by_limit = await client.get(f"/articles/{slug}/comments?limit=1")
+    next_cursor = response_by_limit.json()["nextCursor"]
+    assert (
+        len(response_by_limit.json()["comments"]) == 1
+    ), "Filtering by limit does not work."
+
+    response_by_cursor = await client.get(
+        f"/articles/{slug}/comments?limit=1&cursor={next_cursor}"
+    )
+    check_content_comment(
+        response_by_cursor.json()["comments"][0], data_comment, data_second_user
+    )
+
 
 async def test_remove_comment(
     db: AsyncSession,
@@ -1,10 +1,19 @@
+import json
+from types import SimpleNamespace
 from typing import AsyncGenerator, Dict, Tuple
 
 import pytest
-from settings import config
+from aioredis import Redis
 from slugify import slugify
 from sqlalchemy import func
 from sqlalchemy.ext.asyncio.session import AsyncSession
+from src.articles.utils import (
+    FAVORITES_LOADED,
+    add_favorited,
+    change_favorites,
+    favorites_key,
+    get_article_key,
+)
 from src.db.models import Favorite
 from starlette.responses import Response
 
@@ -16,8 +25,10 @@ pytestmark = pytest.mark.asyncio
 async def test_post_favorite(
     db: AsyncSession,
     client: AsyncGenerator,
+    redis: Redis,
     data_first_user: Dict[str, Dict[str, str]],
     token_first_user: str,
+    token_second_user: str,
     data_first_article: Dict[str, Dict[str, str]],
     create_and_get_response_two_article: Tuple[Response],
 ) -> None:
@@ -58,11 +69,15 @@ async def test_post_favorite(
     ), "Adding the article to favorites did not change the 'favoritesCount' field."
     assert count_favorites == 1, "The favorite article was not added to the database."
 
-    count_favorites_from_redis = await config.redis_db.hget(
-        "count_favorites", slugify(data_first_article["article"]["title"])
+    cached_article = await redis.get(
+        await get_article_key(
+            redis,
+            slugify(data_first_article["article"]["title"]),
+            data_first_user["user"]["username"],
+        )
     )
-    assert count_favorites == int(
-        count_favorites_from_redis
+    assert (
+        count_favorites == json.loads(cached_article)["favorites_count"]
     ), "The article was not saved in redis cache."
 
     response_double = await client.post(
@@ -78,10 +93,31 @@ async def test_post_favorite(
         count_favorites == 1
     ), "A record with the same fields was created in the database."
 
+    response_another_user = await client.get(
+        f"/articles/{slug_first_article}",
+        headers={"Authorization": f"Token {token_second_user}"},
+    )
+    assert (
+        response_another_user.json()["article"]["favorited"] is False
+    ), "The article is displayed as favorite for another user."
+
+    await client.post(
+        f"/articles/{slug_first_article}/favorite",
+        headers={"Authorization": f"Token {token_second_user}"},
+    )
+    response_first_user = await client.get(
+        f"/articles/{slug_first_article}",
+        headers={"Authorization": f"Token {token_first_user}"},
+    )
+    assert (
+        response_first_user.json()["article"]["favorited"] is True
+    ), "Favorites of another user changed the favorited field."
+
 
 async def test_remove_favorite(
     db: AsyncSession,
     client: AsyncGenerator,
+    redis: Redis,
     data_first_user: Dict[str, Dict[str, str]],
     token_first_user: str,
     data_first_article: Dict[str, Dict[str, str]],
@@ -144,11 +180,15 @@ async def test_remove_favorite(
     check_content_article(content["article"], data_first_article, data_first_user)
     assert count_favorites == 0, "The favorite article was not deleted to the database."
 
-    count_favorites_from_redis = await config.redis_db.hget(
-        "count_favorites", slugify(data_first_article["article"]["title"])
+    cached_article = await redis.get(
+        await get_article_key(
+            redis,
+            slugify(data_first_article["article"]["title"]),
+            data_first_user["user"]["username"],
+        )
     )
-    assert count_favorites == int(
-        count_favorites_from_redis
+    assert (
+        count_favorites == json.loads(cached_article)["favorites_count"]
     ), "The article was not delete in redis cache."
 
     response_double = await client.delete(
@@ -156,3 +196,44 @@ async def test_remove_favorite(
         headers={"Authorization": f"Token {token_first_user}"},
     )
     assert response_double.status_code == 400, "Expected 400 code."
+
+
+async def test_favorites_stale_fill(
+    db: AsyncSession,
+    redis: Redis,
+    data_first_user: Dict[str, Dict[str, str]],
+    token_first_user: str,
+    create_and_get_response_one_article: Response,
+) -> None:
+    """
+    Test a favorites set read before a change of the favorites is not stored
+    and a stored set expires.
+    """
+    username = data_first_user["user"]["username"]
+    slug = create_and_get_response_one_article.json()["article"]["slug"]
+    user = SimpleNamespace(username=username)
+    key = favorites_key(username)
+
+    class ChangedDuringRead:
+        sync_session = db.sync_session
+
+        async def execute(self, stmt):
+            result = await db.execute(stmt)
+            pipe = redis.pipeline(transaction=False)
+            change_favorites(pipe, username, slug, favorited=True)
+            await pipe.execute()
+            return result
+
+        async def close(self):
+            await db.close()
+
+    article = SimpleNamespace(slug=slug)
+    await add_favorited(ChangedDuringRead(), redis, [article], user)
+    assert not await redis.sismember(
+        key, FAVORITES_LOADED
+    ), "The favorites read before the change are stored."
+
+    await redis.delete(key)
+    await add_favorited(db, redis, [article], user)
+    assert await redis.sismember(key, FAVORITES_LOADED)
+    assert await redis.ttl(key) > 0, "The favorites set does not expire."
@@ -1,9 +1,12 @@
 from typing import AsyncGenerator, Dict
 
 import pytest
+from aioredis import Redis
 from sqlalchemy import func
 from sqlalchemy.ext.asyncio.session import AsyncSession
-from src.db.models import Follow
+from sqlalchemy.future import select
+from src.conditional import version_key
+from src.db.models import Follow, User
 
 from .schemas import check_content_profile
 
@@ -47,6 +50,14 @@ async def test_create_folllow(
         count_follow == 1
     ), "Repeated query with the same parameters, led to the creation of a string in the database."
 
+    stmt = await db.execute(
+        select(User.username, User.followers_count, User.following_count)
+    )
+    counters = {row.username: tuple(row[1:]) for row in stmt}
+    author, follower = data_second_user["user"], data_first_user["user"]
+    assert counters[author["username"]] == (1, 0), "Followers count is not updated."
+    assert counters[follower["username"]] == (0, 1), "Following count is not updated."
+
     response_subscribe_for_yourself = await client.post(
         f"/profiles/{data_first_user['user']['username']}/follow",
         headers={"Authorization": f"Token {token_first_user}"},
@@ -91,6 +102,7 @@ async def test_create_folllow(
 async def test_get_profile(
     db: AsyncSession,
     client: AsyncGenerator,
+    redis: Redis,
     token_first_user: str,
     add_second_user: None,
     data_second_user: Dict[str, Dict[str, str]],
@@ -109,6 +121,9 @@ async def test_get_profile(
     assert (
         response_fake_user.status_code == 400
     ), "You can only subscribe to an existing user."
+    assert not await redis.exists(
+        version_key("profile:fakeuser")
+    ), "A version is created for a missing user."
 
     response_without_auth = await client.get(
         f"/profiles/{data_second_user['user']['username']}",
@@ -120,6 +135,10 @@ async def test_get_profile(
         response_without_auth.json()["profile"]["following"] is False
     ), "False to view the profile without logging in."
     check_content_profile(content["profile"], data_second_user)
+    response_etag = await client.get(
+        f"/profiles/{data_second_user['user']['username']}",
+    )
+    assert "etag" in response_etag.headers, "The ETag is not set for a found user."
     response_auth = await client.get(
         f"/profiles/{data_second_user['user']['username']}",
         headers={"Authorization": f"Token {token_first_user}"},
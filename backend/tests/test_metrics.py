@@ -0,0 +1,119 @@
+import asyncio
+from types import SimpleNamespace
+from typing import AsyncGenerator
+
+import pytest
+from settings import config
+from src.db.redis import close_redis, create_redis_async_app
+from src.users.cache import (
+    INVALIDATE_CHANNEL,
+    UserCache,
+    UserSnapshot,
+    listen_invalidations,
+    user_cache,
+)
+
+pytestmark = pytest.mark.asyncio
+
+
+async def test_get_metrics(client: AsyncGenerator) -> None:
+    """
+    Test get usage of the connection pools.
+    Auth not required.
+    """
+    response = await client.get("/metrics")
+    assert response.status_code == 200, "Expected 200 code."
+
+    content = response.json()["database"]
+    assert content["poolSize"] == config.db_engine_options["pool_size"]
+    assert content["checkedOutConnections"] >= 0
+    assert content["timeouts"] == 0, "Connections are not received in time."
+
+    content = response.json()["redis"]
+    assert content["maxConnections"] == config.REDIS_MAX_CONNECTIONS
+    assert (
+        content["createdConnections"]
+        == content["inUseConnections"] + content["idleConnections"]
+    ), "Redis pool usage is not consistent."
+
+
+async def test_user_cache(client: AsyncGenerator, token_first_user: str) -> None:
+    """
+    Test the user is loaded from the user cache after the first request.
+    """
+    await client.get("/user", headers={"Authorization": f"Token {token_first_user}"})
+    before = (await client.get("/metrics")).json()["userCache"]
+    response = await client.get(
+        "/user", headers={"Authorization": f"Token {token_first_user}"}
+    )
+    after = (await client.get("/metrics")).json()["userCache"]
+    assert response.status_code == 200, "Expected 200 code."
+    assert after["hits"] == before["hits"] + 1, "The user is not cached."
+
+    await client.put(
+        "/user",
+        headers={"Authorization": f"Token {token_first_user}"},
+        json={"user": {"bio": "new_bio"}},
+    )
+    response = await client.get(
+        "/user", headers={"Authorization": f"Token {token_first_user}"}
+    )
+    assert (
+        response.json()["user"]["bio"] == "new_bio"
+    ), "The cache is not invalidated after the user update."
+
+
+async def test_user_cache_invalidate_all() -> None:
+    """
+    Test dropping all cached users keeps the statistics.
+    """
+    cache = UserCache(maxsize=2, ttl=60)
+    user = SimpleNamespace(
+        id=1,
+        email="all@user.com",
+        username="all",
+        bio="",
+        image="",
+        token_version=0,
+    )
+    cache.set(UserSnapshot(user))
+    cache.get(1)
+    cache.get(2)
+    cache.invalidate_all()
+    assert cache.get(1) is None, "The cached users are not dropped."
+    stats = cache.stats()
+    assert stats["size"] == 0
+    assert (stats["hits"], stats["misses"]) == (1, 2), "The statistics are reset."
+
+
+async def test_user_cache_idle_listener() -> None:
+    """
+    Test invalidations are received after the channel is idle
+    for longer than the socket timeout.
+    """
+    redis = create_redis_async_app(config.REDIS_URL, socket_timeout=1)
+    listener = asyncio.create_task(listen_invalidations(redis))
+    try:
+        await asyncio.sleep(0.5)
+        user = SimpleNamespace(
+            id=1,
+            email="idle@user.com",
+            username="idle",
+            bio="",
+            image="",
+            token_version=0,
+        )
+        user_cache.set(UserSnapshot(user))
+        await asyncio.sleep(2.5)
+        assert not listener.done(), "The listener stopped on an idle channel."
+        assert (
+            user_cache.get(1) is not None
+        ), "The listener restarted on an idle channel."
+
+        await redis.publish(INVALIDATE_CHANNEL, 1)
+        await asyncio.sleep(1)
+        assert user_cache.get(1) is None, "The invalidation is not received."
+    finally:
+        listener.cancel()
+        user_cache.clear()
+        await close_redis(redis)
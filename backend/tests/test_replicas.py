@@ -0,0 +1,75 @@
+from typing import AsyncGenerator
+
+import pytest
+from fastapi import FastAPI
+from settings import config
+from src.db.database import (
+    ReadReplicas,
+    get_read_sessionmaker,
+    get_request_user_id,
+    stick_to_primary,
+)
+from starlette.requests import Request
+
+pytestmark = pytest.mark.asyncio
+
+
+def make_request(app: FastAPI, token: str = None) -> Request:
+    headers = []
+    if token:
+        headers.append((b"authorization", f"Token {token}".encode()))
+    return Request({"type": "http", "app": app, "method": "GET", "headers": headers})
+
+
+async def test_read_routing(
+    client: AsyncGenerator, app: FastAPI, token_first_user: str
+) -> None:
+    """
+    Test reads go to a replica until the user writes.
+    A second instance is used if DATABASE_REPLICA_URLS is set,
+    otherwise the primary database plays the replica.
+    """
+    replica_urls = [str(url) for url in config.DATABASE_REPLICA_URLS]
+    replicas = app.state.replicas
+    app.state.replicas = ReadReplicas(replica_urls or [config.sqlalchemy_db])
+    try:
+        replica_sessions = [session for _, session in app.state.replicas.replicas]
+        anonymous = make_request(app)
+        assert (
+            await get_read_sessionmaker(anonymous) in replica_sessions
+        ), "Anonymous reads are not sent to a replica."
+
+        request = make_request(app, token_first_user)
+        assert await get_read_sessionmaker(request) in replica_sessions
+
+        await stick_to_primary(request, get_request_user_id(request))
+        assert (
+            await get_read_sessionmaker(request) is app.state.sessionmaker
+        ), "Reads after a write are not sent to the primary."
+        assert await get_read_sessionmaker(anonymous) in replica_sessions
+    finally:
+        await app.state.replicas.dispose()
+        app.state.replicas = replicas
+
+
+async def test_replicas_metrics(client: AsyncGenerator, app: FastAPI) -> None:
+    """
+    Test the connection pool of every replica is reported in the metrics.
+    """
+    replica_urls = [str(url) for url in config.DATABASE_REPLICA_URLS]
+    replicas = app.state.replicas
+    app.state.replicas = ReadReplicas(
+        replica_urls or [config.sqlalchemy_db] * 2, **config.db_engine_options
+    )
+    try:
+        response = await client.get("/metrics")
+        content = response.json()["replicas"]
+        assert len(content) == len(
+            app.state.replicas.replicas
+        ), "Replica pools are not reported."
+        for stats in content:
+            assert stats["poolSize"] == config.db_engine_options["pool_size"]
+            assert stats["checkedOutConnections"] == 0
+    finally:
+        await app.state.replicas.dispose()
+        app.state.replicas = replicas
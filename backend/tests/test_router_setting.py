@@ -0,0 +1,40 @@
+from datetime import datetime
+
+import pytest
+from fastapi import FastAPI
+from httpx import AsyncClient
+from pydantic import BaseModel
+from src.router_setting import APIRouter, FastJSONRoute
+from starlette.responses import Response
+
+pytestmark = pytest.mark.asyncio
+
+
+class Event(BaseModel):
+    createdAt: datetime
+
+
+async def test_fast_json_route() -> None:
+    """
+    Test the status code and headers of the injected Response are kept
+    and datetimes are formatted with the fraction.
+    """
+    router = APIRouter(route_class=FastJSONRoute)
+
+    @router.post("/events", response_model=Event, status_code=201)
+    async def create_event(response: Response):
+        response.status_code = 202
+        response.headers["ETag"] = "etag"
+        return Event(createdAt=datetime(2021, 11, 22, 10))
+
+    app = FastAPI()
+    app.include_router(router)
+    async with AsyncClient(app=app, base_url="http://test") as client:
+        response = await client.post("/events")
+    assert response.status_code == 202, "The status code of the Response is dropped."
+    assert (
+        response.headers["etag"] == "etag"
+    ), "The headers of the Response are dropped."
+    assert response.json() == {
+        "createdAt": "2021-11-22T10:00:00.000000Z"
+    }, "The datetime is expected with the fraction."
@@ -5,6 +5,7 @@ from typing import AsyncGenerator, Dict
 import pytest
 from sqlalchemy import func
 from sqlalchemy.ext.asyncio.session import AsyncSession
+from sqlalchemy.future import select
 from src.db.models import User
 
 from .schemas import check_content_user
@@ -24,6 +25,11 @@ async def test_user_create(
     stmt = await db.execute(func.count(User.id))
     count_user = stmt.scalar()
 
+    stmt = await db.execute(select(User.password))
+    assert (
+        stmt.scalar() != data_first_user["user"]["password"]
+    ), "The password is stored in plain text."
+
     content = response.json()
     check_content_user(content["user"], data_first_user)
 
@@ -137,3 +143,30 @@ async def test_update_user(
         json=update_data_json,
     )
     assert response_fake_token.status_code == 401, "Invalid token."
+
+
+async def test_update_password(
+    client: AsyncGenerator,
+    token_first_user: str,
+) -> None:
+    """
+    Test changing the password revokes the issued tokens.
+    Auth requeired.
+    """
+    response = await client.put(
+        "/user",
+        headers={"Authorization": f"Token {token_first_user}"},
+        json={"user": {"password": "new_password"}},
+    )
+    assert response.status_code == 200, "Expected 200 code."
+    new_token = response.json()["user"]["token"]
+
+    response_old_token = await client.get(
+        "/user", headers={"Authorization": f"Token {token_first_user}"}
+    )
+    assert response_old_token.status_code == 401, "The old token is not revoked."
+
+    response_new_token = await client.get(
+        "/user", headers={"Authorization": f"Token {new_token}"}
+    )
+    assert response_new_token.status_code == 200, "Expected 200 code."